@@ -1,4 +1,5 @@
 import asyncio
+import collections
 import concurrent.futures
 import importlib
 import inspect
@@ -8,28 +9,36 @@ import json
 import logging
 import os
 import os.path
+import queue
 import shutil
 import sys
 import textwrap
+import threading
 import time
 import traceback
 from contextlib import redirect_stdout, redirect_stderr
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, RotatingFileHandler
 
 import aiohttp
 import discord
 from discord.ext import commands
 
+import metrics
+import tracing
 from cogs.database import Database
 from cogs.helper import Helper
 
+log_lock = threading.Lock()  # Records and stdout/stderr writes come from executor, watchdog and writer threads too
 
-class WebSocketErrorHandler(RotatingFileHandler):
-    def __init__(self, bot: "Alice", *args, **kwargs):
+
+class WebSocketErrorHandler(logging.Handler):
+    """Restarts the bot when the same error keeps repeating, runs on the loop so it can stop it"""
+
+    def __init__(self, bot: "Alice", level=logging.ERROR):
         self.last_message = ""
         self.same_message = 0
         self.bot = bot
-        super().__init__(*args, **kwargs)
+        super().__init__(level)
 
     def emit(self, record: logging.LogRecord):
         if record.levelno >= logging.ERROR:
@@ -44,7 +53,348 @@ class WebSocketErrorHandler(RotatingFileHandler):
                     out_file.write(record.msg.split(':')[0])
                 raise KeyboardInterrupt
             self.last_message = record.msg
-        super().emit(record)
+
+
+class LogQueueHandler(QueueHandler):
+    """
+    Only puts records on a bounded queue, the writing happens in LogWriter
+
+    When the queue is full, records below WARNING are dropped, others push out the oldest queued record
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord):
+        # Formatting happens in the writer, only freeze the message so later changes to args don't show up
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        self.dropped += 1
+        if record.levelno < logging.WARNING:
+            return
+        try:
+            self.queue.get_nowait()
+            self.queue.put_nowait(record)
+        except (queue.Empty, queue.Full):
+            pass
+
+
+class RepeatFilter(logging.Filter):
+    """
+    Lets the first record logged with a message template through and counts the rest for window seconds
+
+    Once the window is over a summary of how many were held back is logged
+    """
+
+    def __init__(self, window=10, max_tracked=4096):
+        super().__init__()
+        self.window = window
+        self.max_tracked = max_tracked
+        self.tracked = collections.OrderedDict()  # (name, level, template) -> [window start, held back, message]
+        self.lock = log_lock
+
+    def filter(self, record: logging.LogRecord):
+        if getattr(record, 'summary', False):
+            return True
+        now = time.monotonic()
+        key = (record.name, record.levelno, str(record.msg))
+        with self.lock:
+            summaries = self.summarize(now)
+            entry = self.tracked.get(key)
+            if entry is not None:
+                entry[1] += 1
+            else:
+                self.tracked[key] = [now, 0, record.getMessage()]
+                if len(self.tracked) > self.max_tracked:
+                    summaries += self.summarize(now, force=1)
+        for (name, level, _), message, held_back in summaries:
+            logging.getLogger(name).log(level, "%s (\u00d7%d in last %d seconds)", message, held_back + 1,
+                                        self.window, extra={'summary': True})
+        return entry is None
+
+    def summarize(self, now: float, force=0):
+        """Forgets records whose window is over, returns the ones that had something held back"""
+        summaries = []
+        while self.tracked:
+            key, (start, held_back, message) = next(iter(self.tracked.items()))
+            if now - start < self.window and force <= 0:
+                break
+            force -= 1
+            del self.tracked[key]
+            if held_back:
+                summaries.append((key, message, held_back))
+        return summaries
+
+
+class BudgetFilter(logging.Filter):
+    """
+    Limits how many records noisy loggers get to log per window seconds
+
+    Budgets are per logger and its children. Messages the logger hasn't logged before and anything at WARNING or
+    above always get through, what was held back is summarized when the window is over
+    """
+
+    def __init__(self, budgets: dict, window=60, max_seen=4096):
+        super().__init__()
+        self.budgets = budgets
+        self.window = window
+        self.max_seen = max_seen
+        self.window_start = time.monotonic()
+        self.used = collections.Counter()
+        self.held_back = collections.Counter()
+        self.seen = collections.OrderedDict()  # (budget name, logger name, level, message template)
+        self._budget_names = dict()  # logger name -> budget name or None
+        self.lock = log_lock
+
+    def budget_name(self, name: str):
+        if name not in self._budget_names:
+            self._budget_names[name] = next((i for i in self.budgets if name == i or name.startswith(i + '.')), None)
+        return self._budget_names[name]
+
+    def filter(self, record: logging.LogRecord):
+        if getattr(record, 'summary', False):
+            return True
+        now = time.monotonic()
+        with self.lock:
+            held_back = self.summarize(now) if now - self.window_start >= self.window else dict()
+            passed = self._spend(record)
+        for name, amount in held_back.items():
+            logging.getLogger(name).log(logging.DEBUG, "%d records over budget held back in last %d seconds", amount,
+                                        self.window, extra={'summary': True})
+        return passed
+
+    def _spend(self, record: logging.LogRecord):
+        budget_name = self.budget_name(record.name)
+        if budget_name is None:
+            return True
+        self.used[budget_name] += 1
+        template = (budget_name, record.name, record.levelno, str(record.msg))
+        first = template not in self.seen
+        self.seen[template] = None
+        self.seen.move_to_end(template)
+        if len(self.seen) > self.max_seen:
+            self.seen.popitem(last=False)
+        if first or record.levelno >= logging.WARNING or self.used[budget_name] <= self.budgets[budget_name]:
+            return True
+        self.held_back[budget_name] += 1
+        return False
+
+    def summarize(self, now: float):
+        """Starts a new window, returns budget name -> records held back in the last one"""
+        held_back, self.held_back = self.held_back, collections.Counter()
+        self.used.clear()
+        self.window_start = now
+        return held_back
+
+
+class LogWriter(threading.Thread):
+    """Takes records off the queue in batches and hands them to the handlers, away from the event loop"""
+
+    def __init__(self, log_queue: queue.Queue, *handlers: logging.Handler, batch_size=256):
+        super().__init__(name='log-writer', daemon=True)
+        self.queue = log_queue
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.stopping = False
+
+    def add_handler(self, handler: logging.Handler):
+        self.handlers += (handler,)  # Replaced rather than changed, the writer may be going through it
+
+    def remove_handler(self, handler: logging.Handler):
+        self.handlers = tuple(i for i in self.handlers if i is not handler)
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for record in batch:
+                if record is None:
+                    continue
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+            if self.stopping and self.queue.empty():
+                break
+        for handler in self.handlers:
+            handler.close()
+
+    def stop(self, timeout=5):
+        if self.is_alive():
+            self.stopping = True
+            try:
+                self.queue.put_nowait(None)  # Wakes the writer if it's waiting
+            except queue.Full:
+                pass  # It isn't waiting, it stops once the queue is empty
+            self.join(timeout)
+
+
+class LoopMonitor:
+    """
+    Measures how late the event loop runs a callback scheduled every interval seconds
+
+    A watchdog thread checks that those callbacks keep coming. When one is late by more than block_threshold,
+    whatever is blocking the loop is still running, so the loop thread's stack is captured and logged
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, registry: metrics.Registry, interval=0.5,
+                 block_threshold=0.5, recent=120):
+        self.loop = loop
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.logger = logging.getLogger('alice.loop')
+        self.lag_seconds = registry.histogram('alice_loop_lag_seconds', 'How late the event loop ran a timer',
+                                              buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+        self.blocked_total = registry.counter('alice_loop_blocked_total',
+                                              'Times a callback blocked the event loop past the threshold')
+        self.recent = tracing.RollingPercentiles(recent)
+        self.last_stack = None
+        self.expected = None
+        self.beat = None
+        self.handle = None
+        self.loop_thread = None
+        self.watchdog = None
+        self.stopping = threading.Event()
+
+    def start(self):
+        """Must be called from the loop thread"""
+        if self.handle is not None:
+            return
+        self.loop_thread = threading.get_ident()
+        self.stopping.clear()
+        self.beat = time.monotonic()
+        self.expected = self.loop.time() + self.interval
+        self.handle = self.loop.call_later(self.interval, self._tick)
+        self.watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self.watchdog.start()
+
+    def stop(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        self.stopping.set()
+
+    def _tick(self):
+        now = self.loop.time()
+        lag = max(0.0, now - self.expected)
+        self.lag_seconds.observe(lag)
+        self.recent.add(lag)
+        self.beat = time.monotonic()
+        self.expected = now + self.interval
+        self.handle = self.loop.call_later(self.interval, self._tick)
+
+    def _watch(self):
+        reported = None
+        while not self.stopping.wait(self.block_threshold / 2):
+            beat = self.beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked < self.block_threshold or reported == beat:
+                continue
+            reported = beat
+            frame = sys._current_frames().get(self.loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame else "Loop thread is gone\n"
+            del frame
+            # Logged from here so the stack is written even if the loop never comes back, the log filters lock.
+            # Metrics and last_stack belong to the loop, they are updated once it runs again
+            self.logger.warning(f"Event loop blocked for over {blocked * 1000:.0f}ms, it is running:\n{stack}")
+            self.loop.call_soon_threadsafe(self._blocked, stack)
+
+    def _blocked(self, stack: str):
+        self.last_stack = stack
+        self.blocked_total.inc()
+
+    def percentiles(self, *percents):
+        """Of the recent lags"""
+        return self.recent.percentiles(*percents)
+
+
+class Sampler(threading.Thread):
+    """Counts the stacks the target threads are in every interval seconds until stopped"""
+
+    def __init__(self, targets, interval=0.01):
+        super().__init__(name='sampler', daemon=True)
+        self.targets = targets  # Returns thread ident -> name, asked before every sample
+        self.interval = interval
+        self.stacks = collections.Counter()  # (thread name, outermost frame, ..., innermost frame) -> samples
+        self.samples = 0
+        self.started_at = None
+        self.stopped_at = None
+        self.stopping = threading.Event()
+
+    def run(self):
+        self.started_at = time.monotonic()
+        while not self.stopping.wait(self.interval):
+            frames = sys._current_frames()
+            for ident, name in self.targets().items():
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    stack.append(name)
+                    self.stacks[tuple(reversed(stack))] += 1
+            del frames
+            self.samples += 1
+        self.stopped_at = time.monotonic()
+
+    def stop(self):
+        self.stopping.set()
+
+    def collapsed(self):
+        """The stacks in the collapsed format flamegraph.pl and speedscope read"""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self, top=15):
+        own = collections.Counter()
+        total = collections.Counter()
+        threads = collections.Counter()
+        for stack, count in self.stacks.items():
+            threads[stack[0]] += count
+            own[stack[-1]] += count
+            for frame in set(stack[1:]):
+                total[frame] += count
+        every = sum(threads.values()) or 1
+        lines = [f"{self.samples} samples over {(self.stopped_at or time.monotonic()) - self.started_at:.1f}s, "
+                 f"every {self.interval * 1000:.0f}ms",
+                 ", ".join(f"{name}: {count}" for name, count in threads.most_common()),
+                 "",
+                 f"{'own':>6} {'total':>6}  function"]
+        for frame, count in own.most_common(top):
+            lines.append(f"{count / every:>6.1%} {total[frame] / every:>6.1%}  {frame}")
+        return "\n".join(lines)
+
+    def write(self, directory='logs/profiles'):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.collapsed")
+        with open(path, 'w') as out_file:
+            out_file.write(self.collapsed())
+        return path
+
+
+class AliceContext(commands.Context):
+    """Context that times sending and typing as phases of its invocation"""
+
+    async def send(self, *args, **kwargs):
+        with tracing.Span('send'):
+            return await super().send(*args, **kwargs)
+
+    async def trigger_typing(self):
+        with tracing.Span('typing'):
+            return await super().trigger_typing()
 
 
 class Alice(commands.Bot):
@@ -72,6 +422,27 @@ class Alice(commands.Bot):
         self.executor = concurrent.futures.ThreadPoolExecutor()
         self.database: Database = None
         self.helper: Helper = None
+        self.readiness_events = dict()
+        self.load_times = dict()
+        self.startup_time = None
+        self.sampler = None
+
+        # Metrics, served by Home on /metrics
+        self.metrics = metrics.Registry()
+        self.commands_total = self.metrics.counter('alice_commands_total', 'Commands that finished, by outcome',
+                                                   ('command', 'outcome'))
+        self.command_seconds = self.metrics.histogram('alice_command_seconds', 'Time commands took to finish',
+                                                      ('command',))
+        self.metrics.gauge('alice_gateway_latency_seconds', 'Latency Discord reports for the gateway',
+                           function=lambda: self.latency)
+        self.metrics.gauge('alice_guilds', 'Guilds the bot is in', function=lambda: len(self.guilds))
+        self.metrics.gauge('alice_open_prompts', 'Asker prompts waiting for an answer',
+                           function=lambda: Helper.Asker.open_prompts)
+        self.loop_monitor = LoopMonitor(self.loop, self.metrics, self.config.get('loop_lag_interval', 0.5),
+                                        self.config.get('loop_block_ms', 500) / 1000)
+        self.tracker = tracing.Tracker(self.config.get('timing_samples', 1000), tracing.TraceExporter(
+            'logs/traces', self.config.get('trace_sample_rate', 0.0), self.config.get('trace_slow_ms', 5000),
+            self.loop, self.executor))
 
         # Setup logging
         if not os.path.isdir("logs"):
@@ -80,27 +451,32 @@ class Alice(commands.Bot):
         self.logger = logging.getLogger('alice')
         formatter = logging.Formatter('%(asctime)s %(levelname)-8s [%(name)s] %(message)s')
 
+        # Handlers that touch files or the console run in LogWriter, the loop only queues records
         fh = RotatingFileHandler("logs/info.log", maxBytes=1000000, backupCount=1, encoding='UTF-8')
         fh.setLevel(logging.INFO)
         fh.setFormatter(formatter)
         dh = RotatingFileHandler("logs/debug.log", maxBytes=5000000, backupCount=1, encoding='UTF-8')
         dh.setLevel(1)
         dh.setFormatter(formatter)
-        self.alice_handler = WebSocketErrorHandler(bot=self,
-                                                   filename="logs/alice.log",
-                                                   maxBytes=1000000,
-                                                   backupCount=1,
-                                                   encoding='UTF-8')
-        self.alice_handler.setLevel(1)
-        self.alice_handler.setFormatter(formatter)
+        ah = RotatingFileHandler("logs/alice.log", maxBytes=1000000, backupCount=1, encoding='UTF-8')
+        ah.setLevel(1)
+        ah.setFormatter(formatter)
+        ah.addFilter(logging.Filter('alice'))
         sh = logging.StreamHandler()
         sh.setLevel(logging.INFO)
         sh.setFormatter(formatter)
+        log_queue = queue.Queue(self.config.get('log_queue_size', 10000))
+        self.log_writer = LogWriter(log_queue, fh, sh, dh, ah)
+        self.log_writer.start()
+        self.log_handler = LogQueueHandler(log_queue)
+        self.log_handler.addFilter(RepeatFilter(self.config.get('log_repeat_window', 10)))
+        self.log_handler.addFilter(BudgetFilter(self.config.get('log_budgets', dict())))
+        self.metrics.gauge('alice_log_records_dropped', 'Log records dropped because the log queue was full',
+                           function=lambda: self.log_handler.dropped)
+        self.alice_handler = WebSocketErrorHandler(bot=self)
 
         root_logger.handlers = []
-        root_logger.addHandler(fh)
-        root_logger.addHandler(sh)
-        root_logger.addHandler(dh)
+        root_logger.addHandler(self.log_handler)
         root_logger.setLevel(1)
 
         self.logger.handlers = []
@@ -111,13 +487,58 @@ class Alice(commands.Bot):
         self.remove_command("help")
         for i in [self.reload, self.load, self.unload,
                   self.debug, self.loadconfig, self._latency,
-                  self._exec, self.forceload]:
+                  self._exec, self.forceload, self.profile]:
             self.add_command(i)
         self._last_result = None
 
-    def auto_load(self):
+    def auto_load_names(self):
         return ['helper', 'error_handler', 'database'] + self.config.get('auto_load', [])
 
+    async def auto_load(self):
+        """
+        Loads the auto_load extensions, each one as soon as the ones in its DEPENDENCIES are ready
+
+        Extensions that don't depend on each other don't wait for each other
+        """
+        started = time.perf_counter()
+        timeout = self.config.get('load_timeout', 30)
+
+        async def load(extension):
+            dependencies = tuple()
+            try:
+                lib = importlib.import_module(f"cogs.{extension}")
+                dependencies = getattr(lib, 'DEPENDENCIES', tuple())
+                await asyncio.wait_for(asyncio.gather(*[self.readiness(i).wait() for i in dependencies]), timeout)
+                self.load_extension(f"cogs.{extension}")
+            except asyncio.TimeoutError:
+                waiting = [i for i in dependencies if not self.readiness(i).is_set()]
+                self.logger.info(f"Failed to load extension {extension}\nGave up waiting for {', '.join(waiting)}")
+            except Exception as e:
+                self.logger.info('Failed to load extension {}\n{}: {}'.format(extension, type(e).__name__, e))
+            else:
+                self.load_times[extension] = time.perf_counter() - started
+                self.logger.info(f"Successfully loaded {extension} after {self.load_times[extension]:.3f}s")
+
+        await asyncio.gather(*[load(i) for i in dict.fromkeys(self.auto_load_names())])
+        self.startup_time = time.perf_counter() - started
+        self.logger.info(f"Loading extensions took {self.startup_time:.3f}s")
+
+    def readiness(self, name: str) -> asyncio.Event:
+        """Event that is set while the extension or resource with that name is ready to be used"""
+        if name not in self.readiness_events:
+            self.readiness_events[name] = asyncio.Event()
+        return self.readiness_events[name]
+
+    def load_extension(self, name):
+        super().load_extension(name)
+        # Extensions that have to start something first set their readiness themselves
+        if not getattr(self.extensions.get(name), 'SIGNALS_READY', False):
+            self.readiness(name.replace("cogs.", "")).set()
+
+    def unload_extension(self, name):
+        self.readiness(name.replace("cogs.", "")).clear()
+        super().unload_extension(name)
+
     async def on_ready(self):
         app = await self.application_info()
         self.owner_id = app.owner.id
@@ -137,6 +558,24 @@ class Alice(commands.Bot):
         self.logger.info(f"{len(self.commands)} commands")
         self.logger.info('------')
 
+    async def start(self, *args, **kwargs):
+        self.loop_monitor.start()
+        await super().start(*args, **kwargs)
+
+    def log_to_file(self, name: str, filename: str, max_bytes=5000000):
+        """Writes the records of logger name and its children to filename from the log writer"""
+        handler = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=1, encoding='UTF-8', delay=True)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)-8s [%(name)s] %(message)s'))
+        handler.setLevel(1)
+        handler.addFilter(logging.Filter(name))
+        self.log_writer.add_handler(handler)
+        return handler
+
+    async def close(self):
+        await super().close()
+        self.loop_monitor.stop()
+        self.log_writer.stop()  # Writes out what's still queued
+
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
         if not await self.is_owner(discord.Object(payload.user_id)):
             return
@@ -165,7 +604,39 @@ class Alice(commands.Bot):
             ]  # mention needs to be first to get triggered
         return await super().get_prefix(message)
 
+    async def get_context(self, message: discord.Message, *, cls=AliceContext):
+        started = time.perf_counter()
+        ctx = await super().get_context(message, cls=cls)
+        ctx.received_at = started
+        ctx.prefix_found_at = time.perf_counter()
+        return ctx
+
+    async def invoke(self, ctx: commands.Context):
+        if ctx.command is None:
+            return await super().invoke(ctx)
+        invocation = self.tracker.start(ctx.command.qualified_name, ctx.message.id, getattr(ctx, 'received_at', None))
+        if hasattr(ctx, 'prefix_found_at'):
+            invocation.add('prefix', ctx.received_at, ctx.prefix_found_at)
+        try:
+            await super().invoke(ctx)
+        finally:
+            self.tracker.finish(invocation)
+
+    async def on_command(self, ctx: commands.Context):
+        ctx.started_at = time.perf_counter()
+
+    async def on_command_completion(self, ctx: commands.Context):
+        self.record_command(ctx, 'completed')
+
+    def record_command(self, ctx: commands.Context, outcome: str):
+        if ctx.command is None:
+            return
+        self.commands_total.inc(command=ctx.command.qualified_name, outcome=outcome)
+        if hasattr(ctx, 'started_at'):
+            self.command_seconds.observe(time.perf_counter() - ctx.started_at, command=ctx.command.qualified_name)
+
     async def on_command_error(self, ctx: commands.Context, err):
+        self.record_command(ctx, 'failed')
         if self.get_cog('ErrorCog'):
             return
         await super().on_command_error(ctx, err)
@@ -176,7 +647,7 @@ class Alice(commands.Bot):
     @commands.is_owner()
     async def reload(self, ctx):
         """Reload all extensions"""
-        for ext in set([i.replace("cogs.", "") for i in self.extensions.keys()] + self.auto_load()):
+        for ext in set([i.replace("cogs.", "") for i in self.extensions.keys()] + self.auto_load_names()):
             await self.load_cog(ctx, ext, True)
         await ctx.send("Reloaded already loaded cogs and cogs under auto_load")
 
@@ -409,6 +880,48 @@ class Alice(commands.Bot):
             except discord.Forbidden:
                 pass
 
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def profile(self, ctx, duration: str = '30s', top: int = 15):
+        """
+        Samples what the loop and executor threads run, like profile 30s
+        """
+        if self.sampler is not None:
+            await ctx.send("Already profiling")
+            return
+        units = {'s': 1, 'm': 60}
+        try:
+            if duration[-1] in units:
+                seconds = float(duration[:-1]) * units[duration[-1]]
+            else:
+                seconds = float(duration)
+        except ValueError:
+            seconds = 0
+        if seconds <= 0:
+            await ctx.send("Give the duration like 30s or 2m")
+            return
+        seconds = min(seconds, self.config.get('profile_max_seconds', 300))
+        loop_thread = threading.get_ident()
+
+        def targets():
+            found = {loop_thread: 'loop'}
+            # noinspection PyProtectedMember
+            for thread in list(self.executor._threads):
+                found[thread.ident] = thread.name
+            return found
+
+        sampler = self.sampler = Sampler(targets, self.config.get('profile_interval', 0.01))
+        sampler.start()
+        await self.helper.react_or_false(ctx, ['\u23f1'])
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            sampler.stop()
+            self.sampler = None
+        await self.loop.run_in_executor(self.executor, sampler.join)
+        path = await self.loop.run_in_executor(self.executor, sampler.write)
+        await self.send_or_post_hastebin(ctx, f"```\n{sampler.summary(top)}\n\nStacks are in {path}\n```")
+
     @commands.command(name='latency', aliases=['ping', 'marco', 'hello', 'hi', 'hey'])
     @commands.cooldown(1, 60, commands.BucketType.user)
     async def _latency(self, ctx):
@@ -447,21 +960,25 @@ class RedirectToLog(io.StringIO):
     def __init__(self, level: int = logging.INFO, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.level = level
-        self._buffer = ''
+        self._buffer = []
+
+    def _log_buffer(self):
+        with log_lock:
+            buffer, self._buffer = self._buffer, []
+        if buffer:
+            logging.log(level=self.level, msg="".join(buffer))
 
     async def flush_task(self):
         try:
             while asyncio.get_event_loop().is_running():
                 await asyncio.sleep(1)
-                if self._buffer:
-                    logging.log(level=self.level, msg=self._buffer)
-                    self._buffer = ''
+                self._log_buffer()
         except asyncio.CancelledError:
-            if self._buffer:
-                logging.log(level=self.level, msg=self._buffer)
+            self._log_buffer()
 
     def write(self, *args, **kwargs):
-        self._buffer += " ".join(args)
+        with log_lock:
+            self._buffer.append(" ".join(args))
 
 
 if __name__ == '__main__':
@@ -486,12 +1003,7 @@ if __name__ == '__main__':
             alice.logger.info(f"Running python version {sys.version}")
             alice.logger.info("Initializing")
             if alice.config.get('token', ''):
-                for ex in alice.auto_load():
-                    try:
-                        alice.load_extension("cogs.{}".format(ex))
-                        alice.logger.info("Successfully loaded {}".format(ex))
-                    except Exception as e:
-                        alice.logger.info('Failed to load extension {}\n{}: {}'.format(ex, type(e).__name__, e))
+                alice.loop.run_until_complete(alice.auto_load())
                 alice.logger.info("Logging in...\n")
                 alice.run(alice.config.get('token'))
             else:
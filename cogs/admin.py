@@ -1,12 +1,12 @@
 import os
 
-import asyncio
-
 import discord
 from discord.ext import commands
 
 import alice
 
+DEPENDENCIES = ('helper',)
+
 
 class Admin:
     def __init__(self, bot: alice.Alice):
@@ -15,10 +15,7 @@ class Admin:
     @commands.command(aliases=['git'], hidden=True)
     @commands.is_owner()
     async def gitreload(self, ctx: commands.Context):
-        fut = self.bot.loop.run_in_executor(self.bot.executor, os.system, 'git pull')
-        while not fut.done():
-            await asyncio.sleep(0)
-        if not fut.result() == 0:
+        if not await self.bot.loop.run_in_executor(self.bot.executor, os.system, 'git pull') == 0:
             await ctx.send('There was an error pulling from git')
             return
         await ctx.send('Successfully pulled from git')
@@ -55,5 +52,31 @@ class Admin:
         await self.bot.change_presence(status=discord.Status.invisible)
         raise KeyboardInterrupt
 
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def timings(self, ctx: commands.Context, *, command: str = None):
+        """Shows p50/p95/p99 of commands, or of the phases of one command"""
+        tracker = self.bot.tracker
+        if command:
+            found = self.bot.get_command(command)
+            name = found.qualified_name if found else command
+            rows = tracker.phases.get(name)
+            if not rows:
+                await ctx.send(f"No timings for {name} yet")
+                return
+            rows = dict(rows, total=tracker.commands[name])
+        else:
+            rows = tracker.commands
+            if not rows:
+                await ctx.send("No timings yet")
+                return
+        width = max(len(i) for i in rows)
+        lines = [f"{'':<{width}}  {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8}"]
+        for name, rolling in sorted(rows.items(), key=lambda i: -i[1].count):
+            p50, p95, p99 = (i * 1000 for i in rolling.percentiles(50, 95, 99))
+            lines.append(f"{name:<{width}}  {rolling.count:>6} {p50:>6.1f}ms {p95:>6.1f}ms {p99:>6.1f}ms")
+        async with self.bot.helper.message_builder(ctx) as builder:
+            builder.append("```\n" + "\n".join(lines) + "\n```")
+
 def setup(bot):
     bot.add_cog(Admin(bot))
@@ -1,35 +1,149 @@
 import asyncio
+import collections
+import collections.abc
+import time
 
 import asyncpg
 import discord
 
+import tracing
+
 # noinspection PyUnreachableCode
 if False:
     import alice
 
+SIGNALS_READY = True  # Database.start sets it once the pool is up
+
+
+class PrefixCache:
+    """
+    LRU of guild_id -> prefixes
+
+    While ``complete`` is True every guild with prefixes is in here, so a miss means the guild has none.
+    It stops being complete the moment something gets evicted, misses then have to go to the database.
+    """
+
+    def __init__(self, max_guilds: int = 10000):
+        self.max_guilds = max_guilds
+        self.complete = False
+        self.hits = 0
+        self.misses = 0
+        self._prefixes = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._prefixes)
+
+    def fill(self, rows: collections.abc.Iterable):
+        self._prefixes.clear()
+        self.complete = True
+        grouped = collections.OrderedDict()
+        for guild_id, prefix in rows:
+            grouped.setdefault(guild_id, []).append(prefix)
+        for guild_id, prefixes in grouped.items():
+            self.set(guild_id, prefixes)
+
+    def get(self, guild_id: int):
+        try:
+            prefixes = self._prefixes[guild_id]
+        except KeyError:
+            if self.complete:
+                self.hits += 1
+                return tuple()
+            self.misses += 1
+            return None
+        self._prefixes.move_to_end(guild_id)
+        self.hits += 1
+        return prefixes
+
+    def set(self, guild_id: int, prefixes: collections.abc.Iterable):
+        prefixes = tuple(prefixes)
+        if not prefixes and self.complete:
+            self._prefixes.pop(guild_id, None)
+            return
+        self._prefixes[guild_id] = prefixes
+        self._prefixes.move_to_end(guild_id)
+        while len(self._prefixes) > self.max_guilds:
+            self._prefixes.popitem(last=False)
+            self.complete = False
+
+    def add(self, guild_id: int, prefix: str):
+        prefixes = self._prefixes.get(guild_id)
+        if prefixes is None and not self.complete:
+            return  # Unknown guild, next lookup will go to the database anyway
+        self.set(guild_id, (prefixes or tuple()) + (prefix,))
+
+    def remove(self, guild_id: int, prefix: str):
+        prefixes = self._prefixes.get(guild_id)
+        if prefixes is None:
+            return
+        self.set(guild_id, [i for i in prefixes if i != prefix])
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'guilds': len(self._prefixes),
+                'complete': self.complete,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0}
+
+
+class TimedAcquire:
+    """pool.acquire() that records how long it waited for a connection"""
+
+    def __init__(self, pool: asyncpg.pool.Pool, histogram):
+        self.pool = pool
+        self.histogram = histogram
+        self.context = None
+        self.span = tracing.Span('database')
+
+    async def __aenter__(self) -> asyncpg.Connection:
+        self.span.__enter__()
+        started = time.perf_counter()
+        self.context = self.pool.acquire()
+        connection = await self.context.__aenter__()
+        self.histogram.observe(time.perf_counter() - started)
+        return connection
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            return await self.context.__aexit__(exc_type, exc_val, exc_tb)
+        finally:
+            self.span.__exit__(exc_type, exc_val, exc_tb)
+
 
 class Database:
-    def __init__(self, bot: 'alice.Alice', db_host: str, db_name: str, user_name: str, password: str):
+    def __init__(self, bot: 'alice.Alice', db_host: str, db_name: str, user_name: str, password: str,
+                 prefix_cache_size: int = 10000):
         self.bot = bot
         self.db_host = db_host
         self.db_name = db_name
         self.user_name = user_name
         self.password = password
         self.pool: asyncpg.pool.Pool = None
+        self.prefix_cache = PrefixCache(prefix_cache_size)
+        self.acquire_seconds = bot.metrics.histogram('alice_db_acquire_seconds',
+                                                     'Time spent waiting for a database connection')
+        bot.metrics.stats('alice_prefix_cache', 'Guilds, hits and misses of the prefix cache', self.prefix_cache.stats)
 
     async def start(self):
         self.pool = await asyncpg.create_pool(host=self.db_host,
                                               database=self.db_name,
                                               user=self.user_name,
                                               password=self.password)
+        await self.load_prefixes()
         self.bot.database = self
+        self.bot.readiness('database').set()
+
+    def acquire(self):
+        return TimedAcquire(self.pool, self.acquire_seconds)
 
     async def close(self):
+        self.bot.readiness('database').clear()
         self.bot.database = None
         await self.pool.close()
 
     async def table_exists(self, table_name: str):
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             assert isinstance(connection, asyncpg.Connection)
             result = await connection.fetchrow("""
                      SELECT 1
@@ -41,7 +155,7 @@ class Database:
     # region votes
 
     async def create_votes_table(self):
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             assert isinstance(connection, asyncpg.Connection)
             await connection.execute("""
             CREATE TABLE IF NOT EXISTS votes(
@@ -51,7 +165,7 @@ class Database:
             """)
 
     async def add_vote(self, user_id: int):
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             assert isinstance(connection, asyncpg.Connection)
             await connection.execute("""
             INSERT INTO votes(user_id, vote_count)
@@ -61,7 +175,7 @@ class Database:
             """, user_id)
 
     async def get_vote_count(self, user: discord.User):
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             assert isinstance(connection, asyncpg.Connection)
             result = await connection.fetchrow("""
                      SELECT vote_count FROM votes WHERE user_id = $1;
@@ -73,7 +187,7 @@ class Database:
     # region Prefixes
 
     async def create_prefixes_table(self):
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             assert isinstance(connection, asyncpg.Connection)
             await connection.execute("""
             CREATE TABLE IF NOT EXISTS prefixes(
@@ -86,10 +200,26 @@ class Database:
             CREATE INDEX IF NOT EXISTS prefix_index ON prefixes (guild_id);
             """)
 
+    async def load_prefixes(self):
+        """Fills the prefix cache with one query so message handling doesn't need the pool"""
+        if not await self.table_exists('prefixes'):
+            self.prefix_cache.fill([])
+            return
+        async with self.acquire() as connection:
+            assert isinstance(connection, asyncpg.Connection)
+            result = await connection.fetch("""
+                     SELECT guild_id, prefix FROM prefixes;
+                     """)
+        self.prefix_cache.fill((i['guild_id'], i['prefix']) for i in result)
+        self.bot.logger.debug(f"Loaded prefixes for {len(self.prefix_cache)} guilds")
+
     async def count_prefixes(self, guild: discord.Guild):
+        cached = self.prefix_cache.get(guild.id)
+        if cached is not None:
+            return len(cached)
         if not await self.table_exists('prefixes'):
             return 0
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             assert isinstance(connection, asyncpg.Connection)
             result = await connection.fetchrow(
                 """
@@ -99,43 +229,52 @@ class Database:
             return result[0]
 
     async def get_prefixes(self, message: discord.Message):
-        if not await self.table_exists('prefixes'):
-            return []
-        async with self.pool.acquire() as connection:
+        cached = self.prefix_cache.get(message.guild.id)
+        if cached is not None:
+            return list(cached)
+        async with self.acquire() as connection:
             assert isinstance(connection, asyncpg.Connection)
-            result = await connection.fetch("""
-                     SELECT prefix FROM prefixes WHERE guild_id = $1;
-                     """, message.guild.id)
-            return [i['prefix'] for i in result]
+            try:
+                result = await connection.fetch("""
+                         SELECT prefix FROM prefixes WHERE guild_id = $1;
+                         """, message.guild.id)
+            except asyncpg.UndefinedTableError:
+                return []
+        prefixes = [i['prefix'] for i in result]
+        self.prefix_cache.set(message.guild.id, prefixes)
+        return prefixes
 
     async def add_prefix(self, guild: discord.Guild, prefix: str):
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             assert isinstance(connection, asyncpg.Connection)
             await connection.execute("""
             INSERT INTO prefixes (guild_id, prefix)
             VALUES ($1, $2);
             """, *(guild.id, prefix))
+        self.prefix_cache.add(guild.id, prefix)
 
     async def remove_prefix(self, guild: discord.Guild, prefix: str):
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             assert isinstance(connection, asyncpg.Connection)
             result = await connection.fetchrow("""
             DELETE FROM prefixes
             WHERE guild_id = $1 AND prefix = $2
             RETURNING *;
             """, *(guild.id, prefix))
-            return result
+        if result:
+            self.prefix_cache.remove(guild.id, prefix)
+        return result
 
     async def fd(self, query):
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             return await connection.fetch(query)
 
     async def frd(self, query):
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             return await connection.fetchrow(query)
 
     async def ed(self, query):
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             return await connection.execute(query)
 
     # endregion
@@ -147,7 +286,8 @@ def setup(bot: 'alice.Alice'):
                         bot.config.get('DB_host'),
                         bot.config.get('DB_name'),
                         bot.config.get('DB_user'),
-                        bot.config.get('DB_password'))
+                        bot.config.get('DB_password'),
+                        bot.config.get('prefix_cache_size', 10000))
     asyncio.run_coroutine_threadsafe(database.start(), loop=bot.loop)
 
 
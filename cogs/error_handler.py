@@ -1,8 +1,7 @@
-import collections
+import collections.abc
 import logging
 import traceback
 from abc import ABCMeta, abstractmethod
-from logging.handlers import RotatingFileHandler
 
 import discord
 from discord.ext import commands
@@ -11,6 +10,8 @@ from discord.ext import commands
 if False:
     import alice
 
+DEPENDENCIES = ('helper',)
+
 
 class UnhandledError(Exception):
     pass
@@ -57,12 +58,9 @@ class NotFoundHandler(DefaultHandler):
                 logger = ctx.bot.commands_logger
             except AttributeError:
                 logger = logging.getLogger('alice.commands')
-                ch = RotatingFileHandler("logs/commands.log", maxBytes=5000000, backupCount=1, encoding='UTF-8')
-                ch.setFormatter(logging.Formatter('%(asctime)s %(levelname)-8s [%(name)s] %(message)s'))
-                ch.setLevel(1)
                 logger.handlers = []  # Shouldn't matter but still
                 logger.addHandler(ctx.bot.alice_handler)
-                logger.addHandler(ch)
+                ctx.bot.log_to_file('alice.commands', "logs/commands.log")
                 ctx.bot.commands_logger = logger
             logger.info(f'Unknown command: {ctx.invoked_with}')
         else:
@@ -117,7 +115,7 @@ class CanNotSendHandler(DefaultHandler):
 
 
 class HandlersManager:
-    def __init__(self, *args, handlers: collections.Iterable = tuple()):
+    def __init__(self, *args, handlers: collections.abc.Iterable = tuple()):
         self.handlers = list(args + tuple(i for i in handlers))
 
     def add_handler(self, handler: DefaultHandler):
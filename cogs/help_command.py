@@ -1,5 +1,4 @@
 import asyncio
-import concurrent.futures
 import time
 
 import discord
@@ -8,6 +7,8 @@ from discord.ext import commands
 
 import alice
 
+DEPENDENCIES = ('helper',)
+
 
 def custom_ljust(value: str, length: int):
     want = length - len(value)
@@ -32,15 +33,12 @@ class HelpCommand:
         while True:
             try:
                 cpu_fut = self.bot.loop.run_in_executor(self.bot.executor, psutil.cpu_percent, 2)
-                await asyncio.sleep(2.1)
-                while not cpu_fut.done():
-                    await asyncio.sleep(0)
-                self.cpu += cpu_fut.result()
+                self.cpu += await cpu_fut
                 self.cpu /= 2
                 self.memory += psutil.virtual_memory().percent
                 self.memory /= 2
                 await asyncio.sleep(10)
-            except concurrent.futures.CancelledError:
+            except asyncio.CancelledError:
                 break
 
     async def find_guild_invite(self):
@@ -95,8 +93,8 @@ class HelpCommand:
         Lists all visible commands
         """
         try:
-            async with self.bot.helper.AppendOrSend(ctx.author) as appender:
-                await appender.append("Don't forget to also look at ``description`` command. \n\n")
+            async with self.bot.helper.message_builder(ctx.author) as appender:
+                appender.append("Don't forget to also look at ``description`` command. \n\n")
                 last_cog = ""
                 sorted_commands = sorted(self.bot.commands, key=lambda a: a.cog_name + a.name)
                 command_names = dict()
@@ -130,12 +128,12 @@ class HelpCommand:
                     assert isinstance(i, commands.Command)
                     if i.cog_name != last_cog:
                         last_cog = i.cog_name
-                        await appender.append(f"\n```\U0001f916 {last_cog} \U0001f916```")
+                        appender.append(f"\n```\U0001f916 {last_cog} \U0001f916```")
                     help_string = i.brief or f'{i.help or ""}'.split("\n")[0]
-                    await appender.append(
+                    appender.append(
                         f"**``{command_names[f'{prefix}{i.name}']}`` - **{f'{help_string}' if help_string else ''}\n"
                     )
-                await appender.append("\n\nDon't forget to also look at ``description`` command.")
+                appender.append("\n\nDon't forget to also look at ``description`` command.")
 
         except (discord.HTTPException, discord.Forbidden):
             if not await self.bot.helper.react_or_false(ctx, '\u26a0'):
@@ -207,6 +205,8 @@ I take my info from [AniList](https://anilist.co/).
             latency = self.bot.helper.display_time(self.bot.latency)
         else:
             latency = str(latency) + ' ms'
+        lag, worst = self.bot.loop_monitor.percentiles(50, 100)
+        loop_lag = f"{lag * 1000:.1f} ms, worst {worst * 1000:.0f} ms" if lag is not None else "Not measured yet"
         emb = discord.Embed()
         emb.add_field(name='**Current Status**', value=f"""
 **``Commands``** - {len(self.bot.commands)} different commands
@@ -214,6 +214,7 @@ I take my info from [AniList](https://anilist.co/).
 **``\u200b \u200b \u200bUptime``** - {uptime_value}
 **``\u200b \u200b \u200bOnline``** - {discord_value}
 **``\u200b \u200bLatency``** - {latency}
+**``Loop lag``** - {loop_lag}
 **``\u200b \u200b \u200b \u200b \u200b \u200bCPU``** - {int(self.cpu)}%
 **``\u200b \u200b \u200b \u200b \u200b \u200bRAM``** - {int(self.memory)}%
         """)
@@ -1,31 +1,40 @@
 import asyncio
 import collections
-import concurrent.futures
+import collections.abc
+import logging
 import math
 import time
+import weakref
 
-import async_timeout
 import discord
 from discord.ext import commands
 
+import tracing
+
 # noinspection PyUnreachableCode
 if False:
     import alice
 
 
 class Helper:
+    def __init__(self):
+        self.router = Helper.InteractionRouter()
+        self.send_locks = weakref.WeakValueDictionary()  # channel id -> lock of the MessageBuilder sending there
+
+    def message_builder(self, channel: discord.abc.Messageable, limit=2000):
+        """MessageBuilder that doesn't send while another one is sending to the same channel"""
+        target = getattr(channel, 'channel', channel)  # Context sends to its channel
+        key = getattr(target, 'id', id(target))
+        lock = self.send_locks.get(key)
+        if lock is None:
+            lock = self.send_locks[key] = asyncio.Lock()
+        return Helper.MessageBuilder(channel, limit, lock=lock)
+
     # region discord stuff
     @staticmethod
-    async def react_or_false(ctx, reactions: collections.Iterable = ("\u2705",)):
+    async def react_or_false(ctx, reactions: collections.abc.Iterable = ("\u2705",)):
         if ctx.channel.permissions_for(ctx.me).add_reactions:
-            aa = True
-            for r in reactions:
-                try:
-                    await ctx.message.add_reaction(r)
-                except:
-                    aa = False
-                    continue
-            return aa
+            return await Helper.ReactionPipeline(ctx.bot.loop, ctx.message, reactions, ordered=False)
         return False
 
     @staticmethod
@@ -108,6 +117,31 @@ class Helper:
 
     # region classes
 
+    class Deadline:
+        """Fails the future with TimeoutError once timeout seconds pass without reset() being called"""
+
+        def __init__(self, loop: asyncio.AbstractEventLoop, future: asyncio.Future, timeout=60):
+            self.loop = loop
+            self.future = future
+            self.timeout = timeout
+            self._handle = None
+            self.reset()
+
+        def reset(self):
+            if self._handle is not None:
+                self._handle.cancel()
+            self._handle = self.loop.call_later(self.timeout, self._expire)
+
+        def cancel(self):
+            if self._handle is not None:
+                self._handle.cancel()
+                self._handle = None
+
+        def _expire(self):
+            self._handle = None
+            if not self.future.done():
+                self.future.set_exception(asyncio.TimeoutError())
+
     class AdditionalInfo:
         def __init__(self, ctx: commands.Context, *args, questions: tuple = tuple(), ):
             self.ctx = ctx
@@ -119,45 +153,77 @@ class Helper:
             return self.ask_for_more_info().__await__()
 
         async def ask_for_more_info(self):
-            async def message_waiter(answer_fut: asyncio.Future):
-                def message_check(message: discord.Message):
-                    return message.author.id == self.ctx.author.id and message.channel.id == self.ctx.channel.id
-
-                msg = await self.ctx.bot.wait_for('message', check=message_check)
-                answer_fut.set_result(msg.content)
+            def on_message(message: discord.Message):
+                if not answer.done():
+                    answer.set_result(message.content)
 
             answers = []
             for question in self.questions:
                 await self.ctx.send(question)
-                answer = asyncio.Future()
-                task = self.ctx.bot.loop.create_task(message_waiter(answer))
+                answer = self.ctx.bot.loop.create_future()
+                stop_listening = self.ctx.bot.helper.router.listen_messages(self.ctx.channel.id, self.ctx.author.id,
+                                                                            on_message)
+                deadline = Helper.Deadline(self.ctx.bot.loop, answer)
                 try:
-                    async with async_timeout.timeout(60):
-                        while not answer.done():
-                            await asyncio.sleep(0)
-                except asyncio.TimeoutError:
-                    raise
-                else:
-                    answers.append(answer.result())
+                    answers.append(await answer)
                 finally:
-                    task.cancel()
+                    deadline.cancel()
+                    stop_listening()
             return answers
 
     class Asker:
-        def __init__(self, ctx: commands.Context, *args, choices: tuple = tuple(), react_with_choice=False):
+        """
+        Asks the user to choose one of the choices, awaiting it returns the index of the chosen one
+
+        ``pages`` can be given instead of choices, it's an async iterator that yields lists of up to 5 choices.
+        Pages are only fetched once the user navigates to them and are kept after that
+        """
+
+        open_prompts = 0
+
+        def __init__(self, ctx: commands.Context, *args, choices: tuple = tuple(), pages=None,
+                     react_with_choice=False):
             self.ctx = ctx
             self.choices = []
             for choice in args + choices:
-                if hasattr(choice, 'discord_str'):
-                    self.choices.append(choice.discord_str())
-                else:
-                    self.choices.append(str(choice))
-            if not self.choices:
+                self.choices.append(Helper.Asker.to_str(choice))
+            self.pages = pages
+            self.pages_lock = asyncio.Lock()
+            self.complete = pages is None
+            if self.complete and not self.choices:
                 raise ValueError("Amount of choices can't be 0")
 
             self.chunks = [i for i in Helper.chunks(self.choices, 5)]
             self.chosen = None
 
+        @staticmethod
+        def to_str(choice):
+            if hasattr(choice, 'discord_str'):
+                return choice.discord_str()
+            return str(choice)
+
+        async def get_chunk(self, index: int):
+            # Fetches pages up to index, returns the index that is actually available
+            async with self.pages_lock:
+                while not self.complete and len(self.chunks) <= index:
+                    try:
+                        chunk = await self.pages.__anext__()
+                    except StopAsyncIteration:
+                        self.complete = True
+                        break
+                    chunk = [Helper.Asker.to_str(choice) for choice in chunk]
+                    if chunk:
+                        self.chunks.append(chunk)
+                        self.choices.extend(chunk)
+            if not self.chunks:
+                raise ValueError("Amount of choices can't be 0")
+            if self.complete:
+                return index % len(self.chunks)
+            return Helper.clamp(0, index, len(self.chunks) - 1)  # Can't wrap around before knowing the last page
+
+        def has_more_pages(self):
+            return not self.complete or len(self.chunks) > 1
+
         def get_choice(self):
             return self.chosen
 
@@ -170,12 +236,13 @@ class Helper:
             if self.chosen:
                 raise asyncio.InvalidStateError
 
-            if len(self.choices) == 1:
+            await self.get_chunk(0)
+            if len(self.chunks[0]) < 5:
+                await self.get_chunk(1)  # A short first page is usually the last one, this finds out
+            if self.complete and len(self.choices) == 1:
                 self.chosen = 0
                 return self.chosen
 
-            wait_until = time.time() + 60
-
             def embed_helper():
                 emb = discord.Embed(
                     title="Please choose",
@@ -184,236 +251,419 @@ class Helper:
                         for i in range(len(self.chunks[chunks_index]))
                     ]).strip()
                 )
-                if len(self.chunks) > 1:
-                    emb.set_footer(text=f"Page {chunks_index+1}/{len(self.chunks)}. Say 'next' or 'back' to navigate,"
-                                        f" say 'cancel' to stop")
+                if self.has_more_pages():
+                    emb.set_footer(text=f"Page {chunks_index+1}/{len(self.chunks) if self.complete else '?'}. "
+                                        f"Say 'next' or 'back' to navigate, say 'cancel' to stop")
                 else:
                     emb.set_footer(text=f"Say 'cancel' to stop")
                 return emb
 
-            async def navigation_manager_r(msg: discord.Message):
-                def nav_check(r: discord.Reaction, u: discord.User):
-                    return all([
-                        u.id == self.ctx.author.id,
-                        r.message.id == msg.id,
-                        r.emoji in '\u25c0\u25b6'
-                    ])
-
-                while True:
-                    try:
-                        reaction, user = await self.ctx.bot.wait_for('reaction_add', check=nav_check)
-                        nonlocal chunks_index
-                        chunks_index += '\u25c0_\u25b6'.find(reaction.emoji) - 1
-                        chunks_index %= len(self.chunks)
-                        try:
-                            await msg.remove_reaction(reaction, user)
-                        except:
-                            pass
-                        await msg.edit(embed=embed_helper())
-                        nonlocal wait_until
-                        wait_until = time.time() + 60
-                    except concurrent.futures.CancelledError:
-                        break
-
-            async def navigation_manager_m(msg: discord.Message):
-                def message_check(m: discord.Message):
-                    if not m.content:
-                        return False
-                    return all([
-                        m.author.id == self.ctx.author.id,
-                        m.channel.id == self.ctx.channel.id,
-                        m.content[0].lower() in "nb"
-                    ])
-
-                while True:
-                    try:
-                        message = await self.ctx.bot.wait_for('message', check=message_check)
-                        nonlocal chunks_index
-                        chunks_index += "b_n".find(message.content[0].lower()) - 1
-                        chunks_index %= len(self.chunks)
-                        try:
-                            await message.delete()
-                        except discord.Forbidden:
-                            pass
-                        await msg.edit(embed=embed_helper())
-                        nonlocal wait_until
-                        wait_until = time.time() + 60
-                    except concurrent.futures.CancelledError:
-                        break
-
-            async def stop_waiter_r(msg: discord.Message, choice_fut: asyncio.Future):
-                def stop_check(r: discord.Reaction, u: discord.User):
-                    return all([
-                        u.id == self.ctx.author.id,
-                        r.message.id == msg.id,
-                        r.emoji == '\u23f9'
-                    ])
-
-                await self.ctx.bot.wait_for('reaction_add', check=stop_check)
+            async def delete_quietly(message: discord.Message):
                 try:
-                    choice_fut.set_result(None)
-                except asyncio.InvalidStateError:
-                    return
+                    await message.delete()
+                except discord.Forbidden:
+                    pass
 
-            async def stop_waiter_m(msg: discord.Message, choice_fut: asyncio.Future):
-                def message_check(m: discord.Message):
-                    if not m.content:
-                        return False
-                    return all([
-                        m.author.id == self.ctx.author.id,
-                        m.channel.id == self.ctx.channel.id,
-                        m.content[0].lower() in "cs"
-                    ])
-
-                msg = await self.ctx.bot.wait_for('message', check=message_check)
+            async def remove_quietly(reaction: discord.Reaction, user: discord.User):
                 try:
-                    choice_fut.set_result(None)
-                    try:
-                        await msg.delete()
-                    except discord.Forbidden:
-                        pass
-                except asyncio.InvalidStateError:
-                    return
-
-            async def reaction_waiter(msg: discord.Message, choice_fut: asyncio.Future):
-                def reaction_check(r: discord.Reaction, u: discord.User):
-                    return all([
-                        u.id == self.ctx.author.id,
-                        r.message.id == msg.id,
-                        0 < Helper.reaction_to_number(r.emoji) <= len(self.chunks[chunks_index])
-                    ])
+                    await reaction.message.remove_reaction(reaction, user)
+                except:
+                    pass
 
-                reaction, user = await self.ctx.bot.wait_for('reaction_add', check=reaction_check)
+            async def navigate(step: int, cleanup):
+                nonlocal chunks_index
                 try:
-                    choice_fut.set_result(Helper.reaction_to_number(reaction.emoji))
-                except asyncio.InvalidStateError:
-                    return
+                    async with navigation_lock:
+                        chunks_index = await self.get_chunk(chunks_index + step)
+                        await cleanup
+                        await asker.edit(embed=embed_helper())
+                        deadline.reset()
+                except asyncio.CancelledError:
+                    pass
+                finally:
+                    cleanup.close()  # Does nothing if it was awaited, keeps it from warning if it wasn't
 
-            async def message_waiter(choice_fut: asyncio.Future):
-                def message_check(message: discord.Message):
-                    try:
-                        number = int(message.content)
-                    except:
-                        return False
-                    else:
-                        return all([
-                            message.author.id == self.ctx.author.id,
-                            message.channel.id == self.ctx.channel.id,
-                            0 < number <= len(self.chunks[chunks_index])
-                        ])
+            def choose(number, cleanup=None):
+                if fut.done():
+                    if cleanup is not None:
+                        cleanup.close()
+                    return
+                if number is None:
+                    fut.set_result(None)
+                else:
+                    fut.set_result(sum(len(i) for i in self.chunks[:chunks_index]) + number - 1)
+                if cleanup is not None:
+                    self.ctx.bot.loop.create_task(cleanup)
 
-                msg = await self.ctx.bot.wait_for('message', check=message_check)
-                try:
-                    choice_fut.set_result(int(msg.content))
-                    try:
-                        await msg.delete()
-                    except discord.Forbidden:
-                        pass
-                except asyncio.InvalidStateError:
+            def on_reaction(reaction: discord.Reaction, user: discord.User):
+                if not isinstance(reaction.emoji, str):
                     return
+                if reaction.emoji == '\u23f9':
+                    choose(None)
+                elif reaction.emoji in '\u25c0\u25b6' and has_more_pages:
+                    step = '\u25c0_\u25b6'.find(reaction.emoji) - 1
+                    tasks.append(self.ctx.bot.loop.create_task(navigate(step, remove_quietly(reaction, user))))
+                elif 0 < Helper.reaction_to_number(reaction.emoji) <= len(self.chunks[chunks_index]):
+                    choose(Helper.reaction_to_number(reaction.emoji))
+
+            def on_message(message: discord.Message):
+                if not message.content:
+                    return
+                try:
+                    number = int(message.content)
+                except ValueError:
+                    first = message.content[0].lower()
+                    if first in "cs":
+                        choose(None, delete_quietly(message))
+                    elif first in "nb" and has_more_pages:
+                        step = "b_n".find(first) - 1
+                        tasks.append(self.ctx.bot.loop.create_task(navigate(step, delete_quietly(message))))
+                else:
+                    if 0 < number <= len(self.chunks[chunks_index]):
+                        choose(number, delete_quietly(message))
 
             chunks_index = 0
+            has_more_pages = self.has_more_pages()
+            navigation_lock = asyncio.Lock()
+            tasks = []  # Navigation
             asker = await self.ctx.send(embed=embed_helper())
-            fut = asyncio.Future()
-            reaction_task = self.ctx.bot.loop.create_task(reaction_waiter(asker, fut))
-            message_task = self.ctx.bot.loop.create_task(message_waiter(fut))
-            stop_task = self.ctx.bot.loop.create_task(stop_waiter_r(asker, fut))
-            stop_task2 = self.ctx.bot.loop.create_task(stop_waiter_m(asker, fut))
-            if len(self.chunks) > 1:
-                navigation_task_r = self.ctx.bot.loop.create_task(navigation_manager_r(asker))
-                navigation_task_m = self.ctx.bot.loop.create_task(navigation_manager_m(asker))
+            fut = self.ctx.bot.loop.create_future()
+            deadline = Helper.Deadline(self.ctx.bot.loop, fut)
+            router = self.ctx.bot.helper.router
+            stop_reactions = router.listen_reactions(asker.id, self.ctx.author.id, on_reaction)
+            stop_messages = router.listen_messages(self.ctx.channel.id, self.ctx.author.id, on_message)
+            reactions = None
             if self.ctx.channel.permissions_for(self.ctx.me).add_reactions:
-                await asker.add_reaction('\u23f9')
-                for em in map(Helper.number_to_reaction, range(1, min(len(self.choices) + 1, 6))):
-                    if fut.done():
-                        break
-                    await asker.add_reaction(em)
-                if len(self.chunks) > 1:
-                    for em in '\u25c0\u25b6':
-                        if fut.done():
-                            break
-                        await asker.add_reaction(em)
+                reactions = Helper.ReactionPipeline(self.ctx.bot.loop, asker, [
+                    '\u23f9',
+                    *map(Helper.number_to_reaction, range(1, len(self.chunks[0]) + 1)),
+                    *('\u25c0\u25b6' if has_more_pages else '')
+                ])
             message_exists = True
+            Helper.Asker.open_prompts += 1
             try:
-                while not fut.done() and wait_until >= time.time():
-                    await asyncio.sleep(0)
-                if wait_until < time.time():
-                    raise asyncio.TimeoutError
+                with tracing.Span('prompt'):
+                    await fut
             except asyncio.TimeoutError:
                 await asker.delete()
                 message_exists = False
                 raise
             else:
-                if not fut.result():
+                if fut.result() is None:
                     raise asyncio.TimeoutError
                 else:
-                    self.chosen = chunks_index * 5 + fut.result() - 1
+                    self.chosen = fut.result()
                     return self.chosen
             finally:
-                reaction_task.cancel()
-                message_task.cancel()
-                if len(self.chunks) > 1:
-                    # Because the size of self.chunks doesn't change
-                    # noinspection PyUnboundLocalVariable
-                    navigation_task_r.cancel()
-                    # noinspection PyUnboundLocalVariable
-                    navigation_task_m.cancel()
-                stop_task.cancel()
-                stop_task2.cancel()
+                Helper.Asker.open_prompts -= 1
+                if reactions is not None:
+                    reactions.abort()
+                deadline.cancel()
+                stop_reactions()
+                stop_messages()
+                for task in tasks:
+                    task.cancel()
                 if message_exists:
                     await asker.delete()
 
-    class AppendOrSend:
-        def __init__(self, channel: discord.abc.Messageable):
-            self.data = ""
-            self.joining_data = ""
+    class ReactionPipeline:
+        """
+        Adds reactions to a message in the background, awaiting it returns whether all of them were added
+
+        All adds are started at once so the next one is already waiting when one finishes. discord.py still sends
+        the requests of one route bucket one round trip at a time, in the order they were started, so they show
+        up in order. Ordered stops the rest once one fails so there's no gap, abort() drops whatever isn't added yet
+        """
+        logger = logging.getLogger('alice.reactions')
+
+        def __init__(self, loop: asyncio.AbstractEventLoop, message: discord.Message,
+                     reactions: collections.abc.Iterable = tuple(), *, ordered=True):
+            self.loop = loop
+            self.message = message
+            self.ordered = ordered
+            self.queue = collections.deque(reactions)
+            self.added = 0
+            self.failed = 0
+            self.started_at = time.perf_counter()
+            self.attach_time = None
+            self.aborted = False
+            self.task = None
+            self.sending = []  # Adds that were started and may not be done yet
+            self._wake()
+
+        def add(self, *reactions):
+            self.queue.extend(reactions)
+            self._wake()
+
+        def abort(self):
+            self.aborted = bool(self.queue) or not all(task.done() for task in self.sending)
+            self.queue.clear()
+            if self.task is not None and not self.task.done():
+                self.task.cancel()
+
+        def __await__(self):
+            return self.wait().__await__()
+
+        async def wait(self):
+            while self.task is not None and not self.task.done():
+                try:
+                    await asyncio.shield(self.task)
+                except asyncio.CancelledError:
+                    if not self.task.cancelled():
+                        raise
+            return self.failed == 0 and not self.aborted
+
+        def _wake(self):
+            if self.queue and (self.task is None or self.task.done()):
+                self.task = self.loop.create_task(self._run())
+
+        async def _add(self, reaction):
+            try:
+                with tracing.Span('reactions'):
+                    await self.message.add_reaction(reaction)
+            except discord.NotFound:
+                self.queue.clear()  # Message is gone
+                self.failed += 1
+            except discord.HTTPException:
+                self.failed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                self.logger.warning(f"Adding {reaction} to {self.message.id} failed with {e!r}")
+            else:
+                self.added += 1
+                return True
+            return False
+
+        async def _run(self):
+            try:
+                while self.queue:
+                    batch = list(self.queue)
+                    self.queue.clear()
+                    self.sending = [self.loop.create_task(self._add(i)) for i in batch]  # Started in order
+                    try:
+                        for task in self.sending:
+                            if not await task and self.ordered:
+                                self.queue.clear()
+                                break
+                    finally:
+                        for task in self.sending:
+                            task.cancel()  # Only the ones not done yet, after a failure or when aborted
+            finally:
+                self.attach_time = time.perf_counter() - self.started_at
+                self.logger.debug(f"Added {self.added} reactions to {self.message.id} in {self.attach_time:.3f}s"
+                                  f"{f', {self.failed} failed' if self.failed else ''}"
+                                  f"{', aborted' if self.aborted else ''}")
+
+    class InteractionRouter:
+        """
+        Passes reactions and messages on to whoever is waiting for them
+
+        Listeners are looked up by message id for reactions and by (channel id, user id) for messages,
+        so an event costs the same no matter how many prompts are open
+        """
+
+        def __init__(self):
+            self.reaction_listeners = dict()  # message id -> [(user id, callback)]
+            self.message_listeners = dict()  # (channel id, user id) -> [callback]
+
+        def listen_reactions(self, message_id: int, user_id: int, callback):
+            """Calls callback(reaction, user) for reactions from that user on that message, returns how to stop"""
+            entry = (user_id, callback)
+            self.reaction_listeners.setdefault(message_id, []).append(entry)
+            return lambda: self._remove(self.reaction_listeners, message_id, entry)
+
+        def listen_messages(self, channel_id: int, user_id: int, callback):
+            """Calls callback(message) for messages from that user in that channel, returns how to stop"""
+            key = (channel_id, user_id)
+            self.message_listeners.setdefault(key, []).append(callback)
+            return lambda: self._remove(self.message_listeners, key, callback)
+
+        @staticmethod
+        def _remove(listeners: dict, key, entry):
+            entries = listeners.get(key, [])
+            if entry in entries:
+                entries.remove(entry)
+            if not entries:
+                listeners.pop(key, None)
+
+        def pending(self):
+            return sum(len(i) for i in self.reaction_listeners.values()) + \
+                   sum(len(i) for i in self.message_listeners.values())
+
+        async def on_reaction_add(self, reaction: discord.Reaction, user: discord.User):
+            for user_id, callback in list(self.reaction_listeners.get(reaction.message.id, ())):
+                if user_id == user.id:
+                    callback(reaction, user)
+
+        async def on_message(self, message: discord.Message):
+            for callback in list(self.message_listeners.get((message.channel.id, message.author.id), ())):
+                callback(message)
+
+    class MessageBuilder:
+        """
+        Collects text into messages of at most limit characters and sends them in order in the background
+
+        Text that doesn't fit in one message is split on line ends, code blocks are closed and opened again.
+        Builders sharing a lock take turns, one holds it from its first message until it's closed or has had
+        nothing to send for idle_timeout seconds. Use Helper.message_builder to get one locked per channel
+        """
+        idle_timeout = 5
+
+        def __init__(self, channel: discord.abc.Messageable, limit=2000, *, lock: asyncio.Lock = None):
             self.channel = channel
+            self.limit = limit
+            self.lock = lock or asyncio.Lock()
+            self.parts = []
+            self.length = 0
+            self.joining = False
+            self.queue = asyncio.Queue()
+            self.error = None
+            self.sender = None  # Started with the first message
 
         async def __aenter__(self):
             return self
 
         async def __aexit__(self, exc_type, exc_val, exc_tb):
-            await self.flush()
+            await self.close()
 
-        def _get_all(self):
-            return self.data + self.joining_data
-
-        # TODO: Make it so you could append data bigger than 2000 characters
-        async def append(self, arg: str):
-            if self.joining_data:
-                self.data = self._get_all()
-                self.joining_data = ""
+        def append(self, arg: str):
             if not isinstance(arg, str):
                 arg = str(arg)
-            if len(self._get_all()) + len(arg) > 2000:
-                await self.flush()
-                self.data = arg
-            else:
-                self.data += arg
+            self.joining = False
+            if self.length + len(arg) > self.limit:
+                self.flush()
+            self._add(arg)
 
-        async def append_join(self, arg: str, join_str: str = ", "):
+        def append_join(self, arg: str, join_str: str = ", "):
             if not isinstance(arg, str):
                 arg = str(arg)
-            if len(self._get_all()) + len(join_str + arg) > 2000:
-                await self.flush()
-                self.joining_data = arg
-            else:
-                if self.joining_data:
-                    self.joining_data += join_str
-                self.joining_data += arg
-
-        async def flush(self):
-            if self._get_all():
-                await self.channel.send(self._get_all())
-            self.data = ""
-            self.joining_data = ""
+            if self.joining and self.length + len(join_str + arg) <= self.limit:
+                self._add(join_str + arg)
+                return
+            if self.length + len(arg) > self.limit:
+                self.flush()
+            self._add(arg)
+            self.joining = True
+
+        def _add(self, arg: str):
+            if len(arg) > self.limit:
+                *full, arg = Helper.MessageBuilder.split(arg, self.limit)
+                for message in full:
+                    self._put(message)
+            self.parts.append(arg)
+            self.length += len(arg)
+
+        def flush(self):
+            """Queues what has been collected so far as its own message"""
+            if self.length:
+                self._put("".join(self.parts))
+            self.parts = []
+            self.length = 0
+            self.joining = False
+
+        async def close(self):
+            """Flushes and waits until everything is sent, raises what sending raised"""
+            self.flush()
+            if self.sender is None:
+                return
+            self.queue.put_nowait(None)
+            await self.sender
+            if self.error is not None:
+                raise self.error
+
+        def _put(self, message: str):
+            if self.sender is None:
+                self.sender = asyncio.get_event_loop().create_task(self._send_all())
+            self.queue.put_nowait(message)
+
+        async def _send_all(self):
+            held = False
+            try:
+                while True:
+                    try:
+                        if held:
+                            message = await asyncio.wait_for(self.queue.get(), self.idle_timeout)
+                        else:
+                            message = await self.queue.get()
+                    except asyncio.TimeoutError:
+                        self.lock.release()  # Nothing to send for a while, let the others have a turn
+                        held = False
+                        continue
+                    if message is None:
+                        return
+                    if self.error is not None:
+                        continue  # Drop the rest, close() raises
+                    if not held:
+                        await self.lock.acquire()
+                        held = True
+                    try:
+                        await self.channel.send(message)
+                    except Exception as e:
+                        self.error = e
+            finally:
+                if held:
+                    self.lock.release()
+
+        @staticmethod
+        def split(text: str, limit=2000):
+            """
+            Splits text into pieces of at most limit characters, preferring to split on line ends
+
+            >>> [len(i) for i in Helper.MessageBuilder.split("x" * 1993 + "\\n```py\\n" + "print(1)\\n" * 10 + "```")]
+            [1994, 99]
+            """
+            pieces = []
+            current = []
+            length = 0
+            fence = None  # Code block that is open at the end of current
+
+            def cut():
+                nonlocal current, length
+                if fence is not None:
+                    current.append("```" if current[-1].endswith("\n") else "\n```")
+                pieces.append("".join(current))
+                assert len(pieces[-1]) <= limit
+                current = [fence + "\n"] if fence is not None else []
+                length = len(current[0]) if current else 0
+
+            for line in text.splitlines(keepends=True):
+                rest = line
+                # Room for closing the block, kept from the line that opens it
+                closing = 4 if (fence is not None) != bool(line.count("```") % 2) else 0
+                while rest:
+                    room = limit - length - closing
+                    if len(rest) <= room:
+                        take = rest
+                    elif length > (len(fence) + 1 if fence is not None else 0):
+                        cut()
+                        continue
+                    else:
+                        take = rest[:room]  # Line doesn't fit even in an empty message
+                    current.append(take)
+                    length += len(take)
+                    rest = rest[len(take):]
+                if line.count("```") % 2:
+                    if fence is None:
+                        language = line[line.rfind("```") + 3:].strip()
+                        fence = "```" + (language if language.isalnum() else "")
+                    else:
+                        fence = None
+            if length:
+                pieces.append("".join(current))
+            return pieces
 
     # endregion
 
 
 def setup(bot: 'alice.Alice'):
     bot.helper = Helper()
+    bot.add_listener(bot.helper.router.on_reaction_add, 'on_reaction_add')
+    bot.add_listener(bot.helper.router.on_message, 'on_message')
 
 
 def teardown(bot: 'alice.Alice'):
+    bot.remove_listener(bot.helper.router.on_reaction_add, 'on_reaction_add')
+    bot.remove_listener(bot.helper.router.on_message, 'on_message')
     bot.helper = None
@@ -9,6 +9,8 @@ from io import BytesIO
 import alice
 from cogs import error_handler
 
+DEPENDENCIES = ('helper', 'error_handler')
+
 
 def owner_or_has_perms(**kwargs):
     async def inner(ctx: commands.Context):
@@ -64,8 +66,7 @@ class Home:
             err_cog.add_handler(OnlyMyGuildHandler())
 
     async def db_init(self):
-        while not self.bot.database:
-            await asyncio.sleep(0)
+        await self.bot.readiness('database').wait()
         await self.bot.database.create_votes_table()
 
     def __unload(self):
@@ -77,9 +78,8 @@ class Home:
         return True
 
     async def unloader(self):
-        while not self.server_fut.done():
-            await asyncio.sleep(0)
-        self.server_fut.result().close()
+        server = await asyncio.wrap_future(self.server_fut, loop=self.bot.loop)
+        server.close()
 
     # region events
     async def punish_hoisters(self, member: discord.Member):
@@ -154,4 +154,13 @@ def setup(bot):
             await channel.send(embed=emb)
             return aiohttp.web.Response(text="Success")
 
+    @s_routes.get("/metrics")
+    async def metrics_handler(request: aiohttp.web.Request):
+        bot: alice.Alice = request.app.bot
+
+        if bot.config.get('metrics_auth') and request.headers.get('Authorization') != bot.config.get('metrics_auth'):
+            return aiohttp.web.Response(text='Unauthorized', status=401)
+        return aiohttp.web.Response(body=bot.metrics.render().encode(),
+                                    headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
     bot.add_cog(Home(bot, s_routes))
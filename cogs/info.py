@@ -5,6 +5,8 @@ from discord.ext import commands
 
 import alice
 
+DEPENDENCIES = ('helper',)
+
 
 class GuildChannelConverter(commands.Converter):
     def convert(self, ctx, argument):
@@ -119,21 +121,21 @@ class Info:
     @commands.cooldown(1, 60, commands.BucketType.user)
     async def mutualservers(self, ctx, member: discord.Member = None):
         """Shows the servers both the bot and the user are in"""
-        appender = self.bot.helper.AppendOrSend(ctx)
+        appender = self.bot.helper.message_builder(ctx)
         if member and not await self.bot.is_owner(ctx.author):
             await ctx.send("I won't show you servers some other person is in")
             return
         elif member:
-            appender = self.bot.helper.AppendOrSend(ctx.author)
+            appender = self.bot.helper.message_builder(ctx.author)
             await self.bot.helper.react_or_false(ctx, "\U0001f4eb")
         async with appender:
-            await appender.append('We are both in these servers:\n')
+            appender.append('We are both in these servers:\n')
             for guild in self.bot.guilds:
                 if member:
                     if member in guild.members:
-                        await appender.append_join(self.bot.helper.safety_escape_monospace(guild.name))
+                        appender.append_join(self.bot.helper.safety_escape_monospace(guild.name))
                 elif ctx.author in guild.members:
-                    await appender.append_join(self.bot.helper.safety_escape_monospace(guild.name))
+                    appender.append_join(self.bot.helper.safety_escape_monospace(guild.name))
 
     @mutualservers.error
     async def servers_error(self, ctx, error):
@@ -1,9 +1,13 @@
 import asyncio
 import collections
-import concurrent.futures
+import collections.abc
+import heapq
 import inspect
 import itertools
+import json
+import re
 import time
+import types
 
 import aiohttp
 import dateutil.parser
@@ -12,9 +16,22 @@ from bs4 import BeautifulSoup as Soup
 from discord.ext import commands
 
 import alice
+import metrics
+import tracing
+from cogs import error_handler
 
 ANILIST_QUERY_URL = 'https://graphql.anilist.co'
 
+# Lower goes first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_SPECULATIVE = 2
+
+# Results keep the arguments their fields were fetched with under this key, fields without any aren't listed
+FETCHED_WITH = '_fetched_with'
+
+DEPENDENCIES = ('helper', 'error_handler')
+
 
 class ResponseError(Exception):
     def __init__(self, status, *args, **kwargs):
@@ -27,37 +44,523 @@ class NSFWBreach(Exception):
     pass
 
 
+class ResponseErrorHandler(error_handler.DefaultHandler):
+    def __init__(self, priority=10):
+        super().__init__(priority)
+
+    async def handle(self, ctx: commands.Context, err: commands.CommandError):
+        if isinstance(err, commands.CommandInvokeError) and isinstance(err.original, ResponseError):
+            if err.original.status == 429:
+                await ctx.send("\u23f3 AniList is getting too many requests from me right now. "
+                               "Please try again in a minute.")
+            else:
+                await ctx.send(f"\u274c AniList responded with an error ({err.original.status}).")
+        else:
+            await super().handle(ctx, err)
+
+
 def merge(a, b, path=None):
-    """merges b into a"""
+    """
+    Merges b into a, in place
+
+    b is the newer data, so where a leaf differs b's value replaces a's instead of raising like it used to.
+    Lists are merged by item id with merge_lists
+    """
     if path is None:
         path = []
+    stale = a.get(FETCHED_WITH)
+    if stale:
+        for key in b:
+            stale.pop(key, None)  # b brings its own arguments for these, if it had any
     for key in b:
         if key in a:
             if isinstance(a[key], dict) and isinstance(b[key], dict):
                 merge(a[key], b[key], path + [str(key)])
-            elif a[key] == b[key]:
-                pass  # same leaf value
+            elif isinstance(a[key], list) and isinstance(b[key], list):
+                a[key] = merge_lists(a[key], b[key], path + [str(key)])
             else:
-                raise Exception('Conflict at %s' % '.'.join(path + [str(key)]))
+                a[key] = b[key]
         else:
             a[key] = b[key]
     return a
 
 
+def merge_lists(a, b, path=None):
+    """b decides what's in the list, items with the same id keep whatever else a knew about them"""
+    known = {i['id']: i for i in a if isinstance(i, dict) and 'id' in i}
+    rv = []
+    for item in b:
+        if isinstance(item, dict) and item.get('id') in known:
+            rv.append(merge(known[item['id']], item, path))
+        else:
+            rv.append(item)
+    return rv
+
+
 # noinspection PyTypeChecker
 class Otaku:
     # region Helpers
+    class ResponseCache:
+        """
+        TTL + LRU cache of raw AniList response bodies
+
+        Bodies are kept as text so every hit parses into a fresh dict, callers are free to mutate what they get.
+        Memory is capped by the total length of the stored bodies.
+        """
+        root_regex = re.compile(r'{\s*(?:\w+\s*:\s*)?(\w+)')
+
+        def __init__(self, max_bytes=16 * 1024 * 1024, ttls: dict = None, default_ttl=300):
+            self.max_bytes = max_bytes
+            self.ttls = {'Page': 300, 'Media': 3600, 'Character': 3600}
+            self.ttls.update(ttls or dict())
+            self.default_ttl = default_ttl
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self._entries = collections.OrderedDict()
+
+        def __len__(self):
+            return len(self._entries)
+
+        @staticmethod
+        def make_key(graphql: dict):
+            return f"{graphql['query']}\n{json.dumps(graphql.get('variables'), sort_keys=True)}"
+
+        def ttl_for(self, query: str):
+            match = self.root_regex.search(query)
+            if match is None:
+                return self.default_ttl
+            return self.ttls.get(match.group(1), self.default_ttl)
+
+        def get(self, key: str):
+            try:
+                expires_at, body = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            if expires_at < time.monotonic():
+                self._pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+        def put(self, key: str, body: str, ttl: float):
+            if ttl <= 0 or len(body) > self.max_bytes:
+                return
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (time.monotonic() + ttl, body)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+        def _pop(self, key: str):
+            _, body = self._entries.pop(key)
+            self.size -= len(body)
+
+        def clear(self):
+            self._entries.clear()
+            self.size = 0
+
+        def stats(self):
+            total = self.hits + self.misses
+            return {'entries': len(self._entries),
+                    'bytes': self.size,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'hit_rate': self.hits / total if total else 0}
+        # end class
+
+    class RequestScheduler:
+        """
+        Hands out AniList request slots based on the rate limit headers
+
+        When the budget is low requests are queued instead of sent, interactive ones first.
+        The last ``reserve`` requests of every window are only given to interactive requests.
+        """
+
+        class Ticket:
+            def __init__(self, priority: int):
+                self.priority = priority
+                self.entry: list = None
+                self.future: asyncio.Future = None
+                self.carrier: 'Otaku.RequestScheduler.Ticket' = None  # Queued in its place while it's in a batch
+
+        def __init__(self, loop: asyncio.AbstractEventLoop, *, limit=90, reserve=10, window=60):
+            self.loop = loop
+            self.limit = limit
+            self.remaining = limit
+            self.reserve = reserve
+            self.window = window
+            self.reset_at = 0
+            self.blocked_until = 0
+            self.rate_limited = 0
+            self.waited = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+            self._queue = []
+            self._counter = itertools.count()
+            self._timer: asyncio.Handle = None
+
+        @property
+        def depth(self):
+            return sum(1 for entry in self._queue if entry[2] is not None and not entry[2].future.done())
+
+        def _allowed(self, priority: int):
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return False
+            if now >= self.reset_at:
+                self.remaining = self.limit
+                self.reset_at = now + self.window
+            if priority == PRIORITY_INTERACTIVE:
+                return self.remaining > 0
+            return self.remaining > self.reserve
+
+        async def slot(self, ticket: 'Otaku.RequestScheduler.Ticket'):
+            if not self._queue and self._allowed(ticket.priority):
+                self.remaining -= 1
+                return
+            ticket.future = self.loop.create_future()
+            self._push(ticket)
+            self._wake()
+            started = time.monotonic()
+            try:
+                await ticket.future
+            finally:
+                waited = time.monotonic() - started
+                self.waited += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+
+        def promote(self, ticket: 'Otaku.RequestScheduler.Ticket', priority: int):
+            if ticket.carrier is not None:
+                self.promote(ticket.carrier, priority)
+            if priority >= ticket.priority:
+                return
+            ticket.priority = priority
+            if ticket.entry is not None and not ticket.future.done():
+                ticket.entry[2] = None  # Leave the old entry in the heap, it'll be skipped
+                self._push(ticket)
+                self._wake()
+
+        def _push(self, ticket: 'Otaku.RequestScheduler.Ticket'):
+            ticket.entry = [ticket.priority, next(self._counter), ticket]
+            heapq.heappush(self._queue, ticket.entry)
+
+        def _wake(self):
+            if self._timer is not None:
+                self._timer.cancel()  # Also called from slot() and promote(), only one timer is kept
+                self._timer = None
+            while self._queue:
+                ticket = self._queue[0][2]
+                if ticket is None or ticket.future.done():
+                    heapq.heappop(self._queue)
+                    continue
+                if not self._allowed(ticket.priority):
+                    break
+                heapq.heappop(self._queue)
+                self.remaining -= 1
+                ticket.future.set_result(None)
+            if self._queue and self._timer is None:
+                delay = max(self.blocked_until, self.reset_at) - time.monotonic()
+                self._timer = self.loop.call_later(max(delay, 0.1), self._wake)
+
+        def update(self, status: int, headers):
+            try:
+                self.limit = int(headers.get('X-RateLimit-Limit', self.limit))
+                self.remaining = min(self.remaining, int(headers['X-RateLimit-Remaining']))
+            except (KeyError, ValueError):
+                pass
+            if status == 429:
+                self.rate_limited += 1
+                self.remaining = 0
+                try:
+                    retry_after = float(headers.get('Retry-After', self.window))
+                except ValueError:
+                    retry_after = self.window
+                self.blocked_until = time.monotonic() + retry_after
+                self.reset_at = self.blocked_until
+            if self._queue:
+                self._wake()
+
+        def close(self):
+            if self._timer is not None:
+                self._timer.cancel()
+            for entry in self._queue:
+                if entry[2] is not None and not entry[2].future.done():
+                    entry[2].future.cancel()
+            self._queue.clear()
+
+        def stats(self):
+            return {'depth': self.depth,
+                    'remaining': self.remaining,
+                    'limit': self.limit,
+                    'rate_limited': self.rate_limited,
+                    'waited': self.waited,
+                    'average_wait': self.total_wait / self.waited if self.waited else 0,
+                    'max_wait': self.max_wait}
+        # end class
+
+    class RequestBatcher:
+        """
+        Collects Media(id:) and Character(id:) lookups made within ``window`` seconds into one aliased query
+
+        Every lookup gets its own copy of the variables (``$id`` becomes ``$id_0``, ``$id_1``, ...) and an alias,
+        the response is then split back up so each caller gets what a query of its own would've returned.
+        """
+        query_regex = re.compile(r'^query\((?P<variables>[^)]*)\){(?P<root>(?P<type>Media|Character)\(.*)}$', re.DOTALL)
+        variable_regex = re.compile(r'\$(\w+)')
+        signature_regex = re.compile(r'\([^)]*\)')
+        field_regex = re.compile(r'\w+')
+
+        def __init__(self, client: 'Otaku.AniListClient', *, window=0.05, max_complexity=300, max_size=10):
+            self.client = client
+            self.window = window
+            self.max_complexity = max_complexity
+            self.max_size = max_size
+            self.batches_sent = 0
+            self.batched = 0
+            self._pending = []
+            self._complexity = 0
+            self._timer: asyncio.Handle = None
+
+        def batchable(self, graphql: dict):
+            return self.window > 0 and self.query_regex.match(graphql['query']) is not None
+
+        def complexity(self, query: str):
+            # Roughly the amount of selected fields, arguments don't count
+            return len(self.field_regex.findall(self.signature_regex.sub('', query)))
+
+        async def submit(self, graphql: dict, ticket: 'Otaku.RequestScheduler.Ticket'):
+            # The ticket is kept so promoting it while it waits here or in a batch still counts
+            complexity = self.complexity(graphql['query'])
+            if self._pending and self._complexity + complexity > self.max_complexity:
+                self.flush()
+            future = self.client.loop.create_future()
+            self._pending.append((graphql, future, ticket))
+            self._complexity += complexity
+            if len(self._pending) >= self.max_size:
+                self.flush()
+            elif self._timer is None:
+                self._timer = self.client.loop.call_later(self.window, self.flush)
+            return await future
+
+        def flush(self):
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            batch, self._pending, self._complexity = self._pending, [], 0
+            if batch:
+                self.client.loop.create_task(self._send(batch))
+
+        def _combine(self, batch: list):
+            variables = []
+            roots = []
+            values = dict()
+            for index, (graphql, _, _) in enumerate(batch):
+                match = self.query_regex.match(graphql['query'])
+                rename = (lambda m, i=index: f"${m.group(1)}_{i}")
+                variables.append(self.variable_regex.sub(rename, match.group('variables')))
+                roots.append(f"r{index}: {self.variable_regex.sub(rename, match.group('root'))}")
+                for name, value in (graphql.get('variables') or dict()).items():
+                    values[f"{name}_{index}"] = value
+            return {'query': f"query({', '.join(variables)}){{{' '.join(roots)}}}",
+                    'variables': values}
+
+        async def _send_one(self, graphql: dict, future: asyncio.Future, ticket: 'Otaku.RequestScheduler.Ticket'):
+            ticket.carrier = None
+            try:
+                body = await self.client.fetch(graphql, ticket)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(body)
+
+        async def _send(self, batch: list):
+            batch = [i for i in batch if not i[1].done()]
+            if len(batch) <= 1:
+                for graphql, future, ticket in batch:
+                    await self._send_one(graphql, future, ticket)
+                return
+            ticket = Otaku.RequestScheduler.Ticket(min(i[2].priority for i in batch))
+            for _, _, member in batch:
+                member.carrier = ticket
+            try:
+                body = await self.client.fetch(self._combine(batch), ticket)
+            except ResponseError as e:
+                if e.status == 429:
+                    for _, future, _ in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    return
+                # Something in there is broken, send them one by one so only its own caller gets the error
+                await asyncio.gather(*[self._send_one(*i) for i in batch])
+                return
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            self.batches_sent += 1
+            self.batched += len(batch)
+            data = json.loads(body).get('data') or dict()
+            missing = []
+            for index, (graphql, future, ticket) in enumerate(batch):
+                if future.done():
+                    continue
+                if data.get(f"r{index}") is None:
+                    # Sent alone it gets the same error as a query of its own would, usually a 404
+                    missing.append((graphql, future, ticket))
+                    continue
+                result_type = self.query_regex.match(graphql['query']).group('type')
+                future.set_result(json.dumps({'data': {result_type: data[f"r{index}"]}}))
+            if missing:
+                await asyncio.gather(*[self._send_one(*i) for i in missing])
+
+        def close(self):
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            for _, future, _ in self._pending:
+                future.cancel()
+            self._pending = []
+            self._complexity = 0
+
+        def stats(self):
+            return {'batches': self.batches_sent,
+                    'batched': self.batched,
+                    'average_size': self.batched / self.batches_sent if self.batches_sent else 0}
+        # end class
+
+    class AniListClient:
+        """Keeps one pooled keep-alive session to AniList instead of a new connection per query"""
+
+        def __init__(self, loop: asyncio.AbstractEventLoop, *, limit=10, dns_ttl=300, keepalive_timeout=30,
+                     cache: 'Otaku.ResponseCache' = None, scheduler: 'Otaku.RequestScheduler' = None,
+                     max_retries=2, batch_window=0.05, batch_complexity=300, registry: 'metrics.Registry' = None):
+            self.loop = loop
+            self.limit = limit
+            self.dns_ttl = dns_ttl
+            self.keepalive_timeout = keepalive_timeout
+            self.cache = cache or Otaku.ResponseCache()
+            self.scheduler = scheduler or Otaku.RequestScheduler(loop)
+            self.max_retries = max_retries
+            self.batcher = Otaku.RequestBatcher(self, window=batch_window, max_complexity=batch_complexity)
+            self.coalesced = 0
+            self._tickets = dict()
+            self._in_flight = dict()
+            self._session: aiohttp.ClientSession = None
+            self.responses = self.request_seconds = None
+            if registry is not None:
+                self.responses = registry.counter('alice_anilist_responses_total', 'AniList responses by status code',
+                                                  ('status',))
+                self.request_seconds = registry.histogram('alice_anilist_request_seconds',
+                                                          'Time AniList took to answer a request')
+                registry.stats('alice_anilist_scheduler', 'Queue depth, rate limit budget and waits of AniList requests',
+                               self.scheduler.stats)
+                registry.stats('alice_anilist_cache', 'Entries, size, hits and misses of the AniList response cache',
+                               self.cache.stats)
+                registry.stats('alice_anilist_batcher', 'Batches of AniList lookups sent and how big they were',
+                               self.batcher.stats)
+
+        @property
+        def session(self) -> aiohttp.ClientSession:
+            # Created lazily so it's made inside a coroutine on the bot loop
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(limit=self.limit,
+                                                 use_dns_cache=True,
+                                                 ttl_dns_cache=self.dns_ttl,
+                                                 keepalive_timeout=self.keepalive_timeout,
+                                                 loop=self.loop)
+                self._session = aiohttp.ClientSession(connector=connector, loop=self.loop)
+            return self._session
+
+        async def post(self, graphql: dict, priority=PRIORITY_INTERACTIVE):
+            key = self.cache.make_key(graphql)
+            body = self.cache.get(key)
+            if body is None:
+                body = await self.single_flight(key, graphql, priority)
+            return json.loads(body)
+
+        async def single_flight(self, key: str, graphql: dict, priority=PRIORITY_INTERACTIVE):
+            # Identical concurrent queries share one request
+            # The request runs in its own task and is shielded, so a cancelled caller doesn't cancel it for others
+            task = self._in_flight.get(key)
+            if task is None:
+                ticket = Otaku.RequestScheduler.Ticket(priority)
+                task = self.loop.create_task(self._fetch_and_cache(key, graphql, ticket))
+                self._in_flight[key] = task
+                self._tickets[key] = ticket
+                task.add_done_callback(lambda t: self._flight_done(key, t))
+            else:
+                self.coalesced += 1
+                # Someone more important is waiting on it now
+                self.scheduler.promote(self._tickets[key], priority)
+            return await asyncio.shield(task)
+
+        def _flight_done(self, key: str, task: asyncio.Task):
+            if self._in_flight.get(key) is task:
+                del self._in_flight[key]
+                del self._tickets[key]
+            if not task.cancelled():
+                task.exception()  # Every caller might've been cancelled, don't let it warn about not retrieving
+
+        async def _fetch_and_cache(self, key: str, graphql: dict, ticket: 'Otaku.RequestScheduler.Ticket'):
+            if self.batcher.batchable(graphql):
+                body = await self.batcher.submit(graphql, ticket)
+            else:
+                body = await self.fetch(graphql, ticket)
+            self.cache.put(key, body, self.cache.ttl_for(graphql['query']))
+            return body
+
+        async def fetch(self, graphql: dict, ticket: 'Otaku.RequestScheduler.Ticket'):
+            attempt = 0
+            while True:
+                await self.scheduler.slot(ticket)
+                started = time.perf_counter()
+                async with self.session.post(url=ANILIST_QUERY_URL,
+                                             json=graphql) as response:
+                    self.scheduler.update(response.status, response.headers)
+                    body = await response.text()
+                    if self.responses is not None:
+                        self.responses.inc(status=response.status)
+                        self.request_seconds.observe(time.perf_counter() - started)
+                    if response.status == 200:
+                        return body
+                    if response.status != 429 or attempt >= self.max_retries:
+                        raise ResponseError(response.status, body)
+                attempt += 1  # Rate limited, the scheduler holds us back until Retry-After has passed
+
+        async def close(self):
+            self.batcher.close()
+            self.scheduler.close()
+            for task in list(self._in_flight.values()):
+                task.cancel()
+            if self._session is not None:
+                await self._session.close()
+                self._session = None
+        # end class
+
+    anilist: AniListClient = None
+
     @staticmethod
-    async def get_anilist_results(graphql: dict, adult=False, result_type='media'):
-        results = []
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url=ANILIST_QUERY_URL,
-                                    json=graphql) as response:
-                if response.status == 200:
-                    jj = await response.json()
-                    results = jj['data']['Page'][result_type]
-                else:
-                    raise ResponseError(response.status, await response.text())
+    async def get_anilist_results(graphql: dict, adult=False, result_type='media', priority=PRIORITY_INTERACTIVE,
+                                  selection: 'Otaku.GraphQLKey' = None):
+        # selection is the key results were asked for with, it's needed when their fields have arguments
+        with tracing.Span('anilist'):
+            jj = await Otaku.anilist.post(graphql, priority)
+        results = jj['data']['Page'][result_type]
+        if selection is not None:
+            for i in results:
+                selection.record_signatures(i)
         try:
             for i in results[:]:
                 if i['isAdult'] and not adult:
@@ -72,29 +575,34 @@ class Otaku:
 
     @staticmethod
     async def get_more_anilist_info(graphql: dict, previous_info: dict,
-                                    score_func=lambda l: sum(l) / float(len(l)), result_type='Media'):
-        result = dict()
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url=ANILIST_QUERY_URL,
-                                    json=graphql) as response:
-                if response.status == 200:
-                    jj = await response.json()
-                    result = merge(previous_info, jj['data'][result_type])
-                else:
-                    raise ResponseError(response.status, await response.text())
+                                    score_func=lambda l: sum(l) / float(len(l)), result_type='Media',
+                                    priority=PRIORITY_INTERACTIVE):
+        # graphql is None when the planner found we already have everything
+        fetched = dict()
+        if graphql is not None:
+            with tracing.Span('anilist'):
+                jj = await Otaku.anilist.post(graphql, priority)
+            fetched = jj['data'][result_type]
+        return Otaku.process_info(fetched, previous_info, score_func)
+
+    @staticmethod
+    def process_info(fetched: dict, previous_info: dict = None, score_func=lambda l: sum(l) / float(len(l))):
         try:
             # Escape html that's in description
             # lxml seems to be the only thing that works
-            result['description'] = Soup(result['description'], "lxml").text
+            with tracing.Span('parse'):
+                fetched['description'] = Soup(fetched['description'], "lxml").text
         except:
             pass
-        try:
-            anilist_scores = [0 for i in range(10)]
-            for score in result['stats']['scoreDistribution']:
-                anilist_scores[score['score'] // 10 - 1] = score['amount']
-            result['alice_score'] = score_func(anilist_scores)
-        except:
-            result['alice_score'] = 'N/A'
+        result = merge(previous_info, fetched) if previous_info is not None else fetched
+        if 'stats' in fetched or 'alice_score' not in result:
+            try:
+                anilist_scores = [0 for i in range(10)]
+                for score in result['stats']['scoreDistribution']:
+                    anilist_scores[score['score'] // 10 - 1] = score['amount']
+                result['alice_score'] = score_func(anilist_scores)
+            except:
+                result['alice_score'] = 'N/A'
         start_date = None
         end_date = None
         try:
@@ -127,80 +635,218 @@ class Otaku:
         return ", ".join(i for i in names if i)
 
     class GraphQLKey:
+        """
+        One field of a GraphQL query and the fields selected under it
+
+        Children are kept in a dict so lookups don't scan, the rendered string and the hash are cached
+        and thrown away whenever this key or anything under it changes.
+        """
+        __slots__ = ('name', 'signature', 'frozen', '_children', '_parent', '_render', '_hash')
+
         def __init__(self, *, name, signature=None, keys: tuple = None):
             self.name = name
             self.signature = signature or ""
-            if keys:
-                for key in keys:
-                    if not isinstance(key, Otaku.GraphQLKey):
-                        raise TypeError
-            self.keys = keys or tuple()
+            self.frozen = False
+            self._children = dict()
+            self._parent = None
+            self._render = None
+            self._hash = None
+            for key in keys or tuple():
+                if not isinstance(key, Otaku.GraphQLKey):
+                    raise TypeError
+                self._attach(key)
+
+        @property
+        def keys(self):
+            return tuple(self._children.values())
+
+        @keys.setter
+        def keys(self, keys: tuple):
+            self._check_frozen()
+            for key in self._children.values():
+                key._parent = None
+            self._children = dict()
+            for key in keys:
+                self._attach(key)
+            self._invalidate()
+
+        def freeze(self):
+            for key in self._children.values():
+                key.freeze()
+            self.frozen = True
+            return self
+
+        def copy(self):
+            """Unfrozen deep copy"""
+            return Otaku.GraphQLKey(name=self.name,
+                                    signature=self.signature,
+                                    keys=tuple(key.copy() for key in self._children.values()))
+
+        def _check_frozen(self):
+            if self.frozen:
+                raise TypeError("frozen GraphQLKey can't be changed, use copy()")
+
+        def _invalidate(self):
+            node = self
+            while node is not None:
+                node._render = None
+                node._hash = None
+                node = node._parent
+
+        def _attach(self, key: 'Otaku.GraphQLKey'):
+            if key._parent is not None or key.frozen:
+                key = key.copy()
+            key._parent = self
+            self._children[key.name] = key
+            return key
+
+        def _detach(self, name: str):
+            key = self._children.pop(name)
+            key._parent = None
 
         def __eq__(self, other):
             if isinstance(other, Otaku.GraphQLKey):
-                return str(self) == str(other)
+                if self is other:
+                    return True
+                return all((self.name == other.name,
+                            self.signature == other.signature,
+                            hash(self) == hash(other),
+                            self._children == other._children))
             if isinstance(other, str):
                 return self.name == other
             return NotImplemented
 
+        def __hash__(self):
+            if self._hash is None:
+                self._hash = hash((self.name, self.signature, frozenset(self._children.values())))
+            return self._hash
+
+        def __contains__(self, item):
+            if isinstance(item, Otaku.GraphQLKey):
+                item = item.name
+            return item in self._children
+
         def __getitem__(self, item) -> 'Otaku.GraphQLKey':
             if isinstance(item, str):
-                for key in self.keys:
-                    if key.name == item:
-                        return key
-                new_key = Otaku.GraphQLKey(name=item)
-                self.keys += (new_key,)
-                return new_key
+                try:
+                    return self._children[item]
+                except KeyError:
+                    self._check_frozen()
+                    key = self._attach(Otaku.GraphQLKey(name=item))
+                    self._invalidate()
+                    return key
             elif isinstance(item, Otaku.GraphQLKey):
-                for key in self.keys:
-                    if key.name == item.name:
-                        return key
-                self.keys += (item,)
-                return item
+                try:
+                    return self._children[item.name]
+                except KeyError:
+                    self._check_frozen()
+                    key = self._attach(item)
+                    self._invalidate()
+                    return key
             raise TypeError
 
         def __str__(self):
-            after = ""
-            if self.signature:
-                after += f"({self.signature})"
-            if self.keys:
-                after += "{" + " ".join(map(str, self.keys)) + "}"
-            return f"{self.name}{after}"
-
-        def __add__(self, other):
+            if self._render is None:
+                after = ""
+                if self.signature:
+                    after += f"({self.signature})"
+                if self._children:
+                    after += "{" + " ".join(map(str, self._children.values())) + "}"
+                self._render = f"{self.name}{after}"
+            return self._render
+
+        def __repr__(self):
+            return f"<GraphQLKey {self}>"
+
+        def _other_key(self, other, operator: str):
             if isinstance(other, dict):
                 other = Otaku.GraphQLKey.from_dict(other, name=self.name)
             if not isinstance(other, Otaku.GraphQLKey):
-                raise TypeError(f"unsupported operand type(s) for +: 'GraphQLKey' and '{type(other)}'")
+                raise TypeError(f"unsupported operand type(s) for {operator}: 'GraphQLKey' and '{type(other)}'")
             if not self.name == other.name:
                 raise ValueError('names must equal')
-            return Otaku.GraphQLKey.from_dict(merge(self.to_dict(), other.to_dict()))
+            return other
+
+        def merge(self, other: 'Otaku.GraphQLKey'):
+            """Adds everything selected in other, in place"""
+            self._check_frozen()
+            for theirs in other._children.values():
+                mine = self._children.get(theirs.name)
+                if mine is None:
+                    self._attach(theirs)
+                elif mine.signature != theirs.signature:
+                    raise ValueError(f"Conflict at {self.name}.{theirs.name}")
+                else:
+                    mine.merge(theirs)
+            self._invalidate()
+            return self
 
-        def __sub__(self, other):
-            if isinstance(other, dict):
-                other = Otaku.GraphQLKey.from_dict(other, name=self.name)
-            if not isinstance(other, Otaku.GraphQLKey):
-                raise TypeError(f"unsupported operand type(s) for -: 'GraphQLKey' and '{type(other)}'")
-            if not self.name == other.name:
-                raise ValueError('names must equal')
-            for key in other.keys:
-                my_keys = tuple()
-                for i in self.keys:
-                    # don't add it back when it's the same thing
-                    if i == key:
-                        continue
-                    # check if it has children and we could subtract those
-                    if i.name == key.name and len(key.keys) > 0:
-                        result = i - key
-                        if len(result.keys) == 0:
-                            continue
-                        my_keys += (result,)
-                    else:
-                        my_keys += (i,)
-
-                self.keys = my_keys
+        def subtract(self, other: 'Otaku.GraphQLKey'):
+            """Removes everything selected in other, in place. Keys left without children are removed too"""
+            self._check_frozen()
+            for theirs in other._children.values():
+                mine = self._children.get(theirs.name)
+                if mine is None:
+                    continue
+                if mine == theirs:
+                    self._detach(mine.name)
+                elif theirs._children:
+                    mine.subtract(theirs)
+                    if not mine._children:
+                        self._detach(mine.name)
+            self._invalidate()
+            return self
+
+        def discard_present(self, data: dict):
+            """
+            Removes everything data already has a value for, in place
+
+            Lists are all or nothing, they're only removed when every item has everything.
+            Values fetched with other arguments than the key has don't count
+            """
+            self._check_frozen()
+            fetched_with = data.get(FETCHED_WITH, dict())
+            for mine in list(self._children.values()):
+                if mine.name not in data or fetched_with.get(mine.name, "") != mine.signature:
+                    continue
+                value = data[mine.name]
+                if not mine._children or value is None:
+                    self._detach(mine.name)
+                elif isinstance(value, dict):
+                    mine.discard_present(value)
+                    if not mine._children:
+                        self._detach(mine.name)
+                elif isinstance(value, list):
+                    if all(isinstance(i, dict) and not mine.copy().discard_present(i)._children for i in value):
+                        self._detach(mine.name)
+            self._invalidate()
             return self
 
+        def record_signatures(self, data: dict):
+            """Notes in data which of its fields were fetched with arguments, so discard_present can tell"""
+            for mine in self._children.values():
+                value = data.get(mine.name)
+                if value is None:
+                    continue
+                if mine.signature:
+                    data.setdefault(FETCHED_WITH, dict())[mine.name] = mine.signature
+                for item in value if isinstance(value, list) else [value]:
+                    if isinstance(item, dict) and mine._children:
+                        mine.record_signatures(item)
+            return data
+
+        def __add__(self, other):
+            return self.copy().merge(self._other_key(other, '+'))
+
+        def __iadd__(self, other):
+            return self.merge(self._other_key(other, '+='))
+
+        def __sub__(self, other):
+            return self.copy().subtract(self._other_key(other, '-'))
+
+        def __isub__(self, other):
+            return self.subtract(self._other_key(other, '-='))
+
         @staticmethod
         def from_dict(dictionary: dict, *, name=None, signature=None):
             if name is None:
@@ -215,33 +861,89 @@ class Otaku:
                 else:
                     rv = Otaku.GraphQLKey(name=name)
                     dictionary = dictionary[name]
+                if not isinstance(dictionary, dict):
+                    return rv
             else:
                 rv = Otaku.GraphQLKey(name=name, signature=signature)
-            for key in dictionary:
+            for key, value in dictionary.items():
                 assert isinstance(key, str)
-                if isinstance(dictionary[key], list):
-                    dictionary[key] = dictionary[key][0]
-                if isinstance(dictionary[key], dict):
-                    _ = rv[Otaku.GraphQLKey.from_dict(dictionary[key], name=key)]
-                elif isinstance(dictionary[key], tuple):
-                    _ = rv[Otaku.GraphQLKey.from_dict(dictionary[key][1], name=key, signature=dictionary[key][0])]
+                if isinstance(value, list):
+                    # Lists come from results, their first item stands for the rest
+                    value = value[0] if value else None
+                if isinstance(value, dict):
+                    rv._attach(Otaku.GraphQLKey.from_dict(value, name=key))
+                elif isinstance(value, tuple):
+                    children = value[1] if isinstance(value[1], dict) else dict()
+                    rv._attach(Otaku.GraphQLKey.from_dict(children, name=key, signature=value[0]))
                 else:
-                    _ = rv[key]
+                    rv._attach(Otaku.GraphQLKey(name=key))
             return rv
 
         def to_dict(self):
-            rv = dict()
+            dd = dict()
+            for key in self._children.values():
+                dd.update(key.to_dict())
             if self.signature:
-                dd = dict()
-                for key_dict in [key.to_dict() for key in self.keys]:
-                    dd = {**dd, **key_dict}
-                rv[self.name] = (self.signature, dd if dd else '_')
-            else:
-                dd = dict()
-                for key_dict in [key.to_dict() for key in self.keys]:
-                    dd = {**dd, **key_dict}
-                rv[self.name] = dd if dd else '_'
-            return rv
+                return {self.name: (self.signature, dd if dd else '_')}
+            return {self.name: dd if dd else '_'}
+
+    class CompiledQuery:
+        """Query that's built and rendered once, ``tree`` is frozen so use ``thaw()`` to get something to change"""
+
+        def __init__(self, name: str, tree: 'Otaku.GraphQLKey'):
+            self.name = name
+            self.tree = tree.freeze()
+            self.text = str(tree)
+            self.result_type = tree.keys[0].name
+
+        def thaw(self):
+            return self.tree.copy()
+
+        def __str__(self):
+            return self.text
+
+    queries = types.MappingProxyType(dict())
+
+    @staticmethod
+    def compile_queries():
+        compiled = dict()
+        for cls in set(Otaku.mediums.values()):
+            for attr in dir(cls):
+                if attr.endswith('_query'):
+                    name = f"{cls.__name__}.{attr[:-len('_query')]}"
+                    compiled[name] = Otaku.CompiledQuery(name, getattr(cls, attr)())
+        return types.MappingProxyType(compiled)
+
+    @staticmethod
+    def speculate(ctx: commands.Context, graph_ql: dict):
+        """Warms the response cache in the background at the lowest priority"""
+        if graph_ql is None:
+            return
+
+        async def runner():
+            try:
+                await Otaku.anilist.post(graph_ql, PRIORITY_SPECULATIVE)
+            except Exception as e:
+                ctx.bot.logger.debug(f"Speculative prefetch failed: {repr(e)}")
+
+        ctx.bot.loop.create_task(runner())
+
+    @staticmethod
+    def plan(graph_ql_key: 'Otaku.GraphQLKey', data: dict):
+        """Trims an unfrozen query down to what data is missing, returns None if nothing is"""
+        root = graph_ql_key.keys[0]
+        root.discard_present(data)
+        if not root.keys:
+            return None
+        return graph_ql_key
+
+    @staticmethod
+    def planned_request(graph_ql_key: 'Otaku.GraphQLKey', data: dict):
+        graph_ql_key = Otaku.plan(graph_ql_key, data)
+        if graph_ql_key is None:
+            return None
+        return {'query': str(graph_ql_key),
+                'variables': {'id': data['id']}}
 
     # noinspection PyMethodMayBeStatic, PyUnusedLocal, PyTypeChecker
     class Medium:
@@ -252,13 +954,40 @@ class Otaku:
             self.instance_created_at = time.time()
             self.result = result or dict()
 
-        async def expand_result(self, graph_ql_key):
-            graph_ql = {'query': str(graph_ql_key),
-                        'variables': {'id': self.id}}
-            result_type = list(graph_ql_key.keys)[0].name
-            self.result = await Otaku.get_more_anilist_info(graph_ql, self.result, result_type=result_type)
+        @classmethod
+        def query(cls, name: str) -> 'Otaku.CompiledQuery':
+            return Otaku.queries[f"{cls.__name__}.{name}"]
+
+        async def expand_result(self, query: 'Otaku.CompiledQuery', priority=PRIORITY_INTERACTIVE):
+            # Only asks for what isn't in self.result yet, doesn't ask at all if everything is
+            self.result.setdefault('id', self.id)
+            graph_ql = Otaku.planned_request(query.thaw(), self.result)
+            if graph_ql is None:
+                return self.result
+            self.result = await Otaku.get_more_anilist_info(graph_ql, self.result,
+                                                            result_type=query.result_type, priority=priority)
             return self.result
 
+        @staticmethod
+        def secondary_queries():
+            # Queries worth warming up once this medium is shown
+            return tuple()
+
+        @classmethod
+        def prefetch(cls, ctx: commands.Context, results: collections.abc.Iterable):
+            # While the user is choosing, fetch what from_results would need for the visible choices
+            if not ctx.bot.config.get('speculative_prefetch'):
+                return
+            for result in results:
+                Otaku.speculate(ctx, Otaku.planned_request(cls.query('populate').thaw(), result))
+
+        def warm(self, ctx: commands.Context):
+            if not ctx.bot.config.get('speculative_prefetch'):
+                return
+            self.result.setdefault('id', self.id)
+            for name in self.secondary_queries():
+                Otaku.speculate(ctx, Otaku.planned_request(self.query(name).thaw(), self.result))
+
         @classmethod
         def callables(cls):
             rv = []
@@ -321,7 +1050,7 @@ class Otaku:
             return self
 
         @staticmethod
-        def generate_asking_list(results: collections.Iterable):
+        def generate_asking_list(results: collections.abc.Iterable):
             asking = []
             for i in results:
                 under = i['title']['english']
@@ -367,12 +1096,33 @@ class Otaku:
             )
             # @formatter:on
 
+        @staticmethod
+        def lucky_query():
+            # Most popular match with everything populate_query has, so lucky search is one request
+            # @formatter:off
+            return Otaku.GraphQLKey.from_dict(
+                {'query': ('$terms: String', {'Page': ('page: 1, perPage: 1', {'media': ('search: $terms, type: ANIME, isAdult: false, sort: POPULARITY_DESC', {'id': '_', 'isAdult': '_', 'popularity': '_', 'siteUrl': '_', 'description': '_', 'episodes': '_', 'title': {'romaji': '_', 'english': '_', 'native': '_'}, 'status': '_', 'stats': {'scoreDistribution': {'score': '_', 'amount': '_'}}, 'startDate': {'year': '_', 'month': '_', 'day': '_'}, 'endDate': {'year': '_', 'month': '_', 'day': '_'}, 'coverImage': {'large': '_'}})})})}
+            )
+            # @formatter:on
+
+        @staticmethod
+        def lucky_adult_query():
+            # @formatter:off
+            return Otaku.GraphQLKey.from_dict(
+                {'query': ('$terms: String', {'Page': ('page: 1, perPage: 1', {'media': ('search: $terms, type: ANIME, sort: POPULARITY_DESC', {'id': '_', 'isAdult': '_', 'popularity': '_', 'siteUrl': '_', 'description': '_', 'episodes': '_', 'title': {'romaji': '_', 'english': '_', 'native': '_'}, 'status': '_', 'stats': {'scoreDistribution': {'score': '_', 'amount': '_'}}, 'startDate': {'year': '_', 'month': '_', 'day': '_'}, 'endDate': {'year': '_', 'month': '_', 'day': '_'}, 'coverImage': {'large': '_'}})})})}
+            )
+            # @formatter:on
+
+        @staticmethod
+        def secondary_queries():
+            return 'manga', 'characters'
+
         # endregion Queries
 
         async def manga(self, ctx: commands.Context, adult=False, lucky=False):
             # Does sort, supports lucky, checks for adult
             await ctx.trigger_typing()
-            await self.expand_result(self.manga_query())
+            await self.expand_result(self.query('manga'))
             relations = self.result['relations']['edges']
             skipped_adult = False
             results = []
@@ -392,6 +1142,7 @@ class Otaku:
             results.sort(key=lambda a: a['popularity'], reverse=True)  # Sort for lucky here
             index = 0
             if not lucky:  # Lucky check here
+                Otaku.Manga.prefetch(ctx, results[:5])
                 index = await ctx.bot.helper.Asker(ctx, *Otaku.Manga.generate_asking_list(results))
             return await Otaku.Manga.from_results(ctx, results[index])
 
@@ -400,7 +1151,7 @@ class Otaku:
             if not adult and self.is_nsfw:  # NSFW check here
                 raise NSFWBreach
             await ctx.trigger_typing()
-            await self.expand_result(self.characters_query())
+            await self.expand_result(self.query('characters'))
             characters = self.result['characters']['nodes']
             if len(characters) == 0:
                 return None
@@ -408,6 +1159,7 @@ class Otaku:
                 i['full_name'] = Otaku.join_names(i['name']['first'], i['name']['last'])
             index = 0
             if not lucky:  # Lucky check here
+                Otaku.Character.prefetch(ctx, characters[:5])
                 index = await ctx.bot.helper.Asker(ctx, *[i['full_name'] for i in characters])
             return await Otaku.Character.from_results(ctx, characters[index], is_adult=self.is_nsfw)
 
@@ -417,25 +1169,32 @@ class Otaku:
             # Returns Anime()
             # Does sort for lucky, supports lucky, supports adult
 
-            graph_ql_key = Otaku.Anime.search_query()
-            graph_ql = {'query': str(graph_ql_key),
+            if lucky:
+                # The most popular match comes with everything from_results needs, so this is one request
+                graph_ql = {'query': Otaku.Anime.query('lucky_adult' if adult else 'lucky').text,
+                            'variables': {'terms': query}}
+                results = await Otaku.get_anilist_results(graph_ql, adult)
+                if results:
+                    return await Otaku.Anime.from_results(
+                        ctx, Otaku.process_info(results[0], score_func=ctx.bot.helper.ci_score))
+                return None
+
+            graph_ql = {'query': Otaku.Anime.query('search').text,
                         'variables': {'terms': query}}
             results = await Otaku.get_anilist_results(graph_ql, adult)  # This sorts and filters nsfw, NSFW check here
 
             if results:
                 index = 0  # Lucky search always returns most popular
                 if not lucky:  # Lucky check here
+                    Otaku.Anime.prefetch(ctx, results[:5])
                     index = await ctx.bot.helper.Asker(ctx, *Otaku.Anime.generate_asking_list(results))
                 return await Otaku.Anime.from_results(ctx, results[index])
 
         @staticmethod
+        @tracing.timed('populate')
         async def from_results(ctx, result):
             await ctx.trigger_typing()
-            graph_ql_key = Otaku.Anime.populate_query()
-            media = graph_ql_key['Media']
-            media -= result
-            graph_ql = {'query': str(graph_ql_key),
-                        'variables': {'id': result['id']}}
+            graph_ql = Otaku.planned_request(Otaku.Anime.query('populate').thaw(), result)
             result = await Otaku.get_more_anilist_info(graph_ql, result, ctx.bot.helper.ci_score)
             return Otaku.Anime(anilist_id=result['id'],
                                name=result['title']['romaji'],
@@ -448,7 +1207,8 @@ class Otaku:
                                status=result['status'].replace("_", " ").capitalize(),
                                start_date=result['formatted_start_date'],
                                end_date=result['formatted_end_date'],
-                               is_nsfw=result['isAdult'])
+                               is_nsfw=result['isAdult'],
+                               result=result)
 
         def to_embed(self):
             embed = discord.Embed(description="\n".join(self.aliases) if self.aliases else None)
@@ -498,7 +1258,7 @@ class Otaku:
             return self
 
         @staticmethod
-        def generate_asking_list(results: collections.Iterable):
+        def generate_asking_list(results: collections.abc.Iterable):
             asking = []
             for i in results:
                 under = i['title']['english']
@@ -539,12 +1299,28 @@ class Otaku:
             )
             # @formatter:on
 
+        @staticmethod
+        def lucky_query():
+            # @formatter:off
+            return Otaku.GraphQLKey.from_dict({'query': ('$terms: String', {'Page': ('page: 1, perPage: 1', {'media': ('search: $terms, format_in: [MANGA, ONE_SHOT], isAdult: false, sort: POPULARITY_DESC', {'id': '_', 'siteUrl': '_', 'description': '_', 'chapters': '_', 'isAdult': '_', 'format': '_', 'popularity': '_', 'title': {'romaji': '_', 'english': '_', 'native': '_'}, 'status': '_', 'stats': {'scoreDistribution': {'score': '_', 'amount': '_'}}, 'startDate': {'year': '_', 'month': '_', 'day': '_'}, 'endDate': {'year': '_', 'month': '_', 'day': '_'}, 'coverImage': {'large': '_'}})})})})
+            # @formatter:on
+
+        @staticmethod
+        def lucky_adult_query():
+            # @formatter:off
+            return Otaku.GraphQLKey.from_dict({'query': ('$terms: String', {'Page': ('page: 1, perPage: 1', {'media': ('search: $terms, format_in: [MANGA, ONE_SHOT], sort: POPULARITY_DESC', {'id': '_', 'siteUrl': '_', 'description': '_', 'chapters': '_', 'isAdult': '_', 'format': '_', 'popularity': '_', 'title': {'romaji': '_', 'english': '_', 'native': '_'}, 'status': '_', 'stats': {'scoreDistribution': {'score': '_', 'amount': '_'}}, 'startDate': {'year': '_', 'month': '_', 'day': '_'}, 'endDate': {'year': '_', 'month': '_', 'day': '_'}, 'coverImage': {'large': '_'}})})})})
+            # @formatter:on
+
+        @staticmethod
+        def secondary_queries():
+            return 'anime', 'characters'
+
         # endregion Queries
 
         async def anime(self, ctx: commands.Context, adult=False, lucky=False):
             # Does sort for lucky, supports lucky, supports adult
             await ctx.trigger_typing()
-            await self.expand_result(self.anime_query())
+            await self.expand_result(self.query('anime'))
             relations = self.result['relations']['edges']
             skipped_adult = False
             results = []
@@ -564,6 +1340,7 @@ class Otaku:
             results.sort(key=lambda a: a['popularity'], reverse=True)  # Sort here
             index = 0
             if not lucky:  # Lucky check here
+                Otaku.Anime.prefetch(ctx, results[:5])
                 index = await ctx.bot.helper.Asker(ctx, *Otaku.Anime.generate_asking_list(results))
             return await Otaku.Anime.from_results(ctx, results[index])
 
@@ -572,7 +1349,7 @@ class Otaku:
             if not adult and self.is_nsfw:  # NSFW check here
                 raise NSFWBreach
             await ctx.trigger_typing()
-            await self.expand_result(self.characters_query())
+            await self.expand_result(self.query('characters'))
             characters = self.result['characters']['nodes']
             if len(characters) == 0:
                 return None
@@ -580,6 +1357,7 @@ class Otaku:
                 i['full_name'] = Otaku.join_names(i['name']['first'], i['name']['last'])
             index = 0
             if not lucky:  # Lucky check here
+                Otaku.Character.prefetch(ctx, characters[:5])
                 index = await ctx.bot.helper.Asker(ctx, *[i['full_name'] for i in characters])
             return await Otaku.Character.from_results(ctx, characters[index], is_adult=self.is_nsfw)
 
@@ -589,8 +1367,17 @@ class Otaku:
             # Returns Manga()
             # Does sort for lucky, supports lucky, supports adult
 
-            graph_ql_key = Otaku.Manga.search_query()
-            graph_ql = {'query': str(graph_ql_key),
+            if lucky:
+                # The most popular match comes with everything from_results needs, so this is one request
+                graph_ql = {'query': Otaku.Manga.query('lucky_adult' if adult else 'lucky').text,
+                            'variables': {'terms': query}}
+                results = await Otaku.get_anilist_results(graph_ql, adult)
+                if results:
+                    return await Otaku.Manga.from_results(
+                        ctx, Otaku.process_info(results[0], score_func=ctx.bot.helper.ci_score))
+                return None
+
+            graph_ql = {'query': Otaku.Manga.query('search').text,
                         'variables': {'terms': query}}
 
             results = await Otaku.get_anilist_results(graph_ql, adult)  # This sorts and filters adult, NSFW check here
@@ -598,6 +1385,7 @@ class Otaku:
                 index = 0  # Lucky search always returns most popular
                 if not lucky:  # Lucky check here
                     # Ask the user what anime they meant
+                    Otaku.Manga.prefetch(ctx, results[:5])
                     index = await ctx.bot.helper.Asker(ctx, *Otaku.Manga.generate_asking_list(results))
 
                 # Query Anilist for all information about that anime
@@ -605,13 +1393,10 @@ class Otaku:
                 return await Otaku.Manga.from_results(ctx, results[index])
 
         @staticmethod
+        @tracing.timed('populate')
         async def from_results(ctx, result):
             await ctx.trigger_typing()
-            graph_ql_key = Otaku.Manga.populate_query()
-            media = graph_ql_key['Media']
-            media -= result
-            graph_ql = {'query': str(graph_ql_key),
-                        'variables': {'id': result['id']}}
+            graph_ql = Otaku.planned_request(Otaku.Manga.query('populate').thaw(), result)
 
             result = await Otaku.get_more_anilist_info(graph_ql,
                                                        result,
@@ -627,7 +1412,8 @@ class Otaku:
                                status=result['status'].replace("_", " ").capitalize(),
                                start_date=result['formatted_start_date'],
                                end_date=result['formatted_end_date'],
-                               is_nsfw=result['isAdult'])
+                               is_nsfw=result['isAdult'],
+                               result=result)
 
         def to_embed(self):
             embed = discord.Embed(description="\n".join(self.aliases) if self.aliases else None)
@@ -677,7 +1463,7 @@ class Otaku:
         @staticmethod
         def search_query():
             # @formatter:off
-            return Otaku.GraphQLKey.from_dict({'query': ('$terms: String', {'Page': ('page: 1, perPage: 500', {'characters': ('search: $terms', {'id': '_', 'name': {'first': '_', 'last': '_'}, 'media': {'nodes': {'id': '_', 'isAdult': '_', 'title': {'romaji': '_'}, 'popularity': '_'}}})})})})
+            return Otaku.GraphQLKey.from_dict({'query': ('$terms: String, $page: Int', {'Page': ('page: $page, perPage: 25', {'pageInfo': {'hasNextPage': '_'}, 'characters': ('search: $terms, sort: FAVOURITES_DESC', {'id': '_', 'name': {'first': '_', 'last': '_'}, 'media': ('sort: POPULARITY_DESC, perPage: 1', {'nodes': {'id': '_', 'isAdult': '_', 'title': {'romaji': '_'}, 'popularity': '_'}})})})})})
             # @ formatter:on
 
         @staticmethod
@@ -692,12 +1478,23 @@ class Otaku:
             return Otaku.GraphQLKey.from_dict({'query': ('$id: Int', {'Character': ('id: $id', {'media': {'nodes': {'id': '_', 'title': {'romaji': '_', 'english': '_'}, 'popularity': '_', 'isAdult': '_', 'type': '_', 'format': '_'}}})})})
             # @formatter:on
 
+        @staticmethod
+        def lucky_query():
+            # AniList can't sort characters by the popularity of their media, favourites is the closest thing
+            # @formatter:off
+            return Otaku.GraphQLKey.from_dict({'query': ('$terms: String', {'Page': ('page: 1, perPage: 1', {'characters': ('search: $terms, sort: FAVOURITES_DESC', {'id': '_', 'description': '_', 'name': {'first': '_', 'last': '_', 'native': '_', 'alternative': '_'}, 'siteUrl': '_', 'image': {'large': '_'}, 'media': ('sort: POPULARITY_DESC, perPage: 1', {'nodes': {'id': '_', 'isAdult': '_', 'title': {'romaji': '_'}, 'popularity': '_'}})})})})})
+            # @formatter:on
+
+        @staticmethod
+        def secondary_queries():
+            return 'medium',
+
         # endregion Queries
 
         async def anime(self, ctx: commands.Context, adult=False, lucky=False):
             # Sorts for lucky, supports lucky, supports adult
             await ctx.trigger_typing()
-            await self.expand_result(self.medium_query())
+            await self.expand_result(self.query('medium'))
             relations = self.result['media']['nodes']
             skipped_adult = False
             results = []
@@ -715,13 +1512,14 @@ class Otaku:
             results.sort(key=lambda a: a['popularity'], reverse=True)  # Sort here
             index = 0
             if not lucky:  # Lucky check here
+                Otaku.Anime.prefetch(ctx, results[:5])
                 index = await ctx.bot.helper.Asker(ctx, *Otaku.Anime.generate_asking_list(results))
             return await Otaku.Anime.from_results(ctx, results[index])
 
         async def manga(self, ctx: commands.Context, adult=False, lucky=False):
             # Sorts for lucky, supports lucky, supports adult
             await ctx.trigger_typing()
-            await self.expand_result(self.medium_query())
+            await self.expand_result(self.query('medium'))
             relations = self.result['media']['nodes']
             skipped_adult = False
             results = []
@@ -739,6 +1537,7 @@ class Otaku:
             results.sort(key=lambda a: a['popularity'], reverse=True)  # Sort here
             index = 0
             if not lucky:  # Lucky check here
+                Otaku.Manga.prefetch(ctx, results[:5])
                 index = await ctx.bot.helper.Asker(ctx, *Otaku.Manga.generate_asking_list(results))
             return await Otaku.Manga.from_results(ctx, results[index])
 
@@ -748,50 +1547,86 @@ class Otaku:
             # Returns Character()
             # Sorts for lucky, supports lucky, supports adult
 
-            graph_ql_key = Otaku.Character.search_query()
-            graph_ql = {'query': str(graph_ql_key),
-                        'variables': {'terms': query}}
-            results = await Otaku.get_anilist_results(graph_ql,
-                                                      adult,
-                                                      result_type='characters')
-            if results:
-                for i in results:
-                    medias = sorted(i['media']['nodes'], key=lambda a: a['popularity'], reverse=True)
-                    i['media']['nodes'] = medias
-                    if not medias:
-                        i['popularity'] = 0
-                        continue
-                    i['popularity'] = medias[0]['popularity']  # Set popularity for sorting
-                results.sort(key=lambda a: a['popularity'], reverse=True)  # Sort here
-
-                # Don't move this code into IF NOT LUCKY block, this checks for ADULT
-                asking = []
-                for i in results[:]:
-                    medias = i['media']['nodes']
-                    i['isAdult'] = False
-                    # TODO: also move this to its own method for Voice actor search later
-                    if not medias or medias[0]['isAdult']:  # NSFW check here
-                        if not medias or not adult:
-                            results.remove(i)  # Remove non-existing (and hentai)
-                            continue
-                        elif medias:
-                            i['isAdult'] = True  # Set hentai to true if we searching for it
-                    under = f"*From {medias[0]['title']['romaji']}*"
-                    i['full_name'] = Otaku.join_names(i['name']['first'], i['name']['last'])
-                    asking.append(f"  **{i['full_name']}**\n\t{under}")
-                # Again, don't move the asking part into IF NOT LUCKY block
+            if lucky:
+                graph_ql = {'query': Otaku.Character.query('lucky').text,
+                            'variables': {'terms': query}}
+                results = await Otaku.get_anilist_results(
+                    graph_ql, adult, result_type='characters',
+                    selection=Otaku.Character.query('lucky').tree['Page']['characters'])
+                medias = results[0]['media']['nodes'] if results else []
+                if medias and (adult or not medias[0]['isAdult']):  # NSFW check here
+                    wanted = Otaku.process_info(results[0])
+                    wanted['isAdult'] = medias[0]['isAdult']
+                    return await Otaku.Character.from_results(ctx, wanted)
+                # Otherwise fall through, the full search knows which character to pick instead
+
+            pages = Otaku.Character.search_pages(query, adult)
+            try:
+                first = await pages.__anext__()
+            except StopAsyncIteration:
+                return None
+            if lucky:  # Lucky check here
+                return await Otaku.Character.from_results(ctx, first[0])  # Lucky search always returns most popular
 
-                index = 0  # Lucky search always returns most popular
-                if not lucky:  # Lucky check here
-                    # Ask the user what anime they meant
-                    index = await ctx.bot.helper.Asker(ctx, *asking)
+            results = list(first)
+
+            async def asking():
+                # Further pages are only searched for once the user goes looking for them
+                yield Otaku.Character.generate_asking_list(first)
+                async for chunk in pages:
+                    results.extend(chunk)
+                    Otaku.Character.prefetch(ctx, chunk)
+                    yield Otaku.Character.generate_asking_list(chunk)
 
-                wanted = results[index]
-                return await Otaku.Character.from_results(ctx, wanted)
+            # Ask the user what character they meant
+            Otaku.Character.prefetch(ctx, first)
+            index = await ctx.bot.helper.Asker(ctx, pages=asking())
+            return await Otaku.Character.from_results(ctx, results[index])
 
         @staticmethod
+        async def search_pages(query: str, adult=False):
+            # Yields the search results 5 at a time, same as Asker shows them
+            page = 1
+            has_next = True
+            while has_next:
+                results, has_next = await Otaku.Character.search_page(query, page, adult)
+                page += 1
+                for i in range(0, len(results), 5):
+                    yield results[i:i + 5]
+
+        @staticmethod
+        async def search_page(query: str, page=1, adult=False, priority=PRIORITY_INTERACTIVE):
+            # One small page of characters, each with only its most popular media
+            # Returns the characters that can be shown and whether AniList has more
+            graph_ql = {'query': Otaku.Character.query('search').text,
+                        'variables': {'terms': query, 'page': page}}
+            with tracing.Span('anilist'):
+                jj = await Otaku.anilist.post(graph_ql, priority)
+            data = jj['data']['Page']
+            selection = Otaku.Character.query('search').tree['Page']['characters']
+            results = []
+            for i in data['characters']:
+                selection.record_signatures(i)
+                medias = i['media']['nodes']
+                if not medias:
+                    continue  # Remove non-existing
+                i['isAdult'] = medias[0]['isAdult']
+                if i['isAdult'] and not adult:  # NSFW check here
+                    continue
+                i['popularity'] = medias[0]['popularity']  # Set popularity for sorting
+                i['full_name'] = Otaku.join_names(i['name']['first'], i['name']['last'])
+                results.append(i)
+            results.sort(key=lambda a: a['popularity'], reverse=True)  # Sort here
+            return results, data['pageInfo']['hasNextPage']
+
+        @staticmethod
+        def generate_asking_list(results: collections.abc.Iterable):
+            return [f"  **{i['full_name']}**\n\t*From {i['media']['nodes'][0]['title']['romaji']}*" for i in results]
+
+        @staticmethod
+        @tracing.timed('populate')
         async def from_results(ctx, result, is_adult=None, full_name=None):
-            graph_ql_key = Otaku.Character.populate_query()
+            graph_ql_key = Otaku.Character.query('populate').thaw()
             ctx.bot.logger.debug(is_adult)
             try:
                 result['isAdult']
@@ -807,12 +1642,8 @@ class Otaku:
                     result['full_name'] = full_name
                 else:
                     name = graph_ql_key['Character']['name']
-                    name += {'name': {'first': '_', 'last': '_'}}
-            chara = graph_ql_key['Character']
-            chara -= result
-
-            graph_ql = {'query': str(graph_ql_key),
-                        'variables': {'id': result['id']}}
+                    name += {'first': '_', 'last': '_'}  # In place, full_name is made from these
+            graph_ql = Otaku.planned_request(graph_ql_key, result)
             await ctx.trigger_typing()
             result = await Otaku.get_more_anilist_info(graph_ql, result, result_type='Character')
             result['description'] = Otaku.clean_descriptions(result['description'])
@@ -825,7 +1656,8 @@ class Otaku:
                                    is_nsfw=result['isAdult'],
                                    description=result['description'],
                                    url=result['siteUrl'],
-                                   cover_url=result['image']['large'])
+                                   cover_url=result['image']['large'],
+                                   result=result)
 
         def to_embed(self):
             embed = discord.Embed(description=f"{', '.join(self.alternative_names)}\n{self.native_name}")
@@ -865,10 +1697,27 @@ class Otaku:
     def __init__(self, bot: alice.Alice):
         self.bot = bot
         self._last_medium = dict()
+        cache = Otaku.ResponseCache(max_bytes=self.bot.config.get('anilist_cache_bytes', 16 * 1024 * 1024),
+                                    ttls=self.bot.config.get('anilist_cache_ttls'))
+        self.anilist = Otaku.AniListClient(self.bot.loop,
+                                           limit=self.bot.config.get('anilist_connection_limit', 10),
+                                           cache=cache,
+                                           scheduler=Otaku.RequestScheduler(
+                                               self.bot.loop,
+                                               limit=self.bot.config.get('anilist_rate_limit', 90),
+                                               reserve=self.bot.config.get('anilist_interactive_reserve', 10)),
+                                           batch_window=self.bot.config.get('anilist_batch_window', 0.05),
+                                           batch_complexity=self.bot.config.get('anilist_batch_complexity', 300),
+                                           registry=self.bot.metrics)
+        Otaku.anilist = self.anilist
         self.cleanup_task = self.bot.loop.create_task(self.cleanuper())
+        err_cog: error_handler.ErrorCog = self.bot.get_cog('ErrorCog')
+        if err_cog:
+            err_cog.add_handler(ResponseErrorHandler())
 
     def __unload(self):
         self.cleanup_task.cancel()
+        asyncio.run_coroutine_threadsafe(self.anilist.close(), self.bot.loop)
 
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
         if payload.emoji.name != '\U0001f6ae':
@@ -893,7 +1742,7 @@ class Otaku:
                         del self._last_medium[k]
                 await asyncio.sleep(60)
             except Exception as ex:
-                if isinstance(ex, concurrent.futures.CancelledError):
+                if isinstance(ex, asyncio.CancelledError):
                     return
 
     async def find_helper(self, ctx, medium_name, query, lucky):
@@ -919,6 +1768,7 @@ class Otaku:
                 text=embed.footer.text + f" ({medium.id}) - Requested by {ctx.author.display_name}, {ctx.author.id}"
             )
             msg = await ctx.send(embed=embed)
+            medium.warm(ctx)
             await msg.add_reaction('\U0001f6ae')
             self._last_medium[ctx.author.id] = medium
             return True
@@ -945,7 +1795,7 @@ class Otaku:
         if query is None:
             try:
                 query = (await self.bot.helper.AdditionalInfo(ctx, *('What do you want to search for?',)))[0]
-            except concurrent.futures.TimeoutError:
+            except asyncio.TimeoutError:
                 try:
                     await ctx.message.delete()
                 except:
@@ -1013,6 +1863,7 @@ class Otaku:
                          f" ({new_medium.id}) - Requested by {ctx.author.display_name}, {ctx.author.id}"
                 )
                 msg = await ctx.send(embed=embed)
+                new_medium.warm(ctx)
                 await msg.add_reaction('\U0001f6ae')
                 self._last_medium[ctx.author.id] = new_medium
                 try:
@@ -1041,5 +1892,8 @@ class Otaku:
     # end class
 
 
+Otaku.queries = Otaku.compile_queries()
+
+
 def setup(bot):
     bot.add_cog(Otaku(bot))
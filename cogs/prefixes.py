@@ -1,10 +1,11 @@
-import asyncio
 import asyncpg
 import discord
 from discord.ext import commands
 
 import alice
 
+DEPENDENCIES = ('helper',)
+
 
 class Prefixes:
     def __init__(self, bot: alice.Alice):
@@ -12,8 +13,7 @@ class Prefixes:
         self.bot.loop.create_task(self.db_init())
 
     async def db_init(self):
-        while not self.bot.database:
-            await asyncio.sleep(0)
+        await self.bot.readiness('database').wait()
         await self.bot.database.create_prefixes_table()
 
     async def __local_check(self, *args):
@@ -2,26 +2,22 @@ import asyncio
 import logging
 import os
 import random
-import concurrent.futures
-from logging.handlers import RotatingFileHandler
 
-import async_timeout
 import dbl
 import discord
 from discord.ext import commands
 
 import alice
 
+DEPENDENCIES = ('helper',)
+
 
 class Presences:
     def __init__(self, bot: alice.Alice):
         self.bot = bot
-        gh = RotatingFileHandler("logs/guilds.log", maxBytes=5000000, backupCount=1, encoding='UTF-8')
-        gh.setFormatter(logging.Formatter('%(asctime)s %(levelname)-8s [%(name)s] %(message)s'))
-        gh.setLevel(1)
         self.guilds_logger = logging.getLogger('alice.guilds')
         self.guilds_logger.handlers = []
-        self.guilds_logger.addHandler(gh)
+        self.guilds_handler = self.bot.log_to_file('alice.guilds', "logs/guilds.log")
 
         self.task = self.bot.loop.create_task(self.presence_updater())
         if not os.path.isfile('status'):
@@ -37,6 +33,8 @@ class Presences:
 
     def __unload(self):
         self.task.cancel()
+        self.bot.log_writer.remove_handler(self.guilds_handler)
+        self.guilds_handler.close()
 
     async def on_guild_join(self, guild: discord.Guild):
         # noinspection PyUnresolvedReferences
@@ -76,14 +74,12 @@ class Presences:
         try:
             # Initial wait
             await self.bot.wait_until_ready()
-            if self.dbl_client:
-                while not self.dbl_client.bot_id:
-                    await asyncio.sleep(0)
+            if self.dbl_client and not self.dbl_client.bot_id:
+                self.dbl_client.bot_id = self.bot.user.id  # dbl sets the same thing once the bot is ready
             # Loop while running
             while self.bot.loop.is_running():
                 try:
-                    while not self.bot.is_ready():
-                        await asyncio.sleep(0)
+                    await self.bot.wait_until_ready()
                     await self.presence()
                     if self.dbl_client:
                         try:
@@ -96,10 +92,10 @@ class Presences:
                             )
                     await asyncio.sleep(600)
                 except Exception as err:
-                    if isinstance(err, concurrent.futures.CancelledError):
+                    if isinstance(err, asyncio.CancelledError):
                         raise
                     self.bot.logger.error(f"Error while updating presence: {repr(err)}")
-        except concurrent.futures.CancelledError:
+        except asyncio.CancelledError:
             pass
 
     @commands.command(hidden=True)
@@ -112,31 +108,18 @@ class Presences:
             my_guild = discord.utils.get(self.bot.guilds, owner=self.bot.user)
             self.emojis = [i for i in my_guild.emojis if hasattr(discord.Status, i.name)]
         if emoji is None:
-            async def reaction_waiter(msg: discord.Message, choice_fut: asyncio.Future):
-                def reaction_check(r: discord.Reaction, u: discord.User):
-                    return all([
-                        u.id == ctx.author.id,
-                        r.message.id == msg.id,
-                        r.emoji in self.emojis])
-
-                reaction, user = await ctx.bot.wait_for('reaction_add', check=reaction_check)
-                try:
-                    choice_fut.set_result(reaction.emoji)
-                except asyncio.InvalidStateError:
-                    return
+            def on_reaction(reaction: discord.Reaction, user: discord.User):
+                if reaction.emoji in self.emojis and not fut.done():
+                    fut.set_result(reaction.emoji)
 
             msg = await ctx.send('Please choose')
-            fut = asyncio.Future()
-            task = self.bot.loop.create_task(reaction_waiter(msg, fut))
-            for i in self.emojis:
-                if fut.done():
-                    break
-                await msg.add_reaction(i)
+            fut = self.bot.loop.create_future()
+            deadline = self.bot.helper.Deadline(self.bot.loop, fut)
+            stop_listening = self.bot.helper.router.listen_reactions(msg.id, ctx.author.id, on_reaction)
+            reactions = self.bot.helper.ReactionPipeline(self.bot.loop, msg, self.emojis)
             message_exists = True
             try:
-                async with async_timeout.timeout(60):
-                    while not fut.done():
-                        await asyncio.sleep(0)
+                await fut
             except asyncio.TimeoutError:
                 await msg.delete()
                 message_exists = False
@@ -144,7 +127,9 @@ class Presences:
             else:
                 emoji = fut.result().name
             finally:
-                task.cancel()
+                reactions.abort()
+                deadline.cancel()
+                stop_listening()
                 if message_exists:
                     await msg.delete()
 
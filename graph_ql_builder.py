@@ -1,97 +1,220 @@
-def merge(a, b, path=None):
-    "merges b into a"
-    if path is None:
-        path = []
-    for key in b:
-        if key in a:
-            if isinstance(a[key], dict) and isinstance(b[key], dict):
-                merge(a[key], b[key], path + [str(key)])
-            elif a[key] == b[key]:
-                pass  # same leaf value
-            else:
-                raise Exception('Conflict at %s' % '.'.join(path + [str(key)]))
-        else:
-            a[key] = b[key]
-    return a
+# Results keep the arguments their fields were fetched with under this key, same as in cogs/otaku.py
+FETCHED_WITH = '_fetched_with'
 
 
 class GraphQLKey:
+    """
+    One field of a GraphQL query and the fields selected under it
+
+    Children are kept in a dict so lookups don't scan, the rendered string and the hash are cached
+    and thrown away whenever this key or anything under it changes.
+    """
+    __slots__ = ('name', 'signature', 'frozen', '_children', '_parent', '_render', '_hash')
+
     def __init__(self, *, name, signature=None, keys: tuple = None):
         self.name = name
         self.signature = signature or ""
-        if keys:
-            for key in keys:
-                if not isinstance(key, GraphQLKey):
-                    raise TypeError
-        self.keys = keys or tuple()
+        self.frozen = False
+        self._children = dict()
+        self._parent = None
+        self._render = None
+        self._hash = None
+        for key in keys or tuple():
+            if not isinstance(key, GraphQLKey):
+                raise TypeError
+            self._attach(key)
+
+    @property
+    def keys(self):
+        return tuple(self._children.values())
+
+    @keys.setter
+    def keys(self, keys: tuple):
+        self._check_frozen()
+        for key in self._children.values():
+            key._parent = None
+        self._children = dict()
+        for key in keys:
+            self._attach(key)
+        self._invalidate()
+
+    def freeze(self):
+        for key in self._children.values():
+            key.freeze()
+        self.frozen = True
+        return self
+
+    def copy(self):
+        """Unfrozen deep copy"""
+        return GraphQLKey(name=self.name,
+                          signature=self.signature,
+                          keys=tuple(key.copy() for key in self._children.values()))
+
+    def _check_frozen(self):
+        if self.frozen:
+            raise TypeError("frozen GraphQLKey can't be changed, use copy()")
+
+    def _invalidate(self):
+        node = self
+        while node is not None:
+            node._render = None
+            node._hash = None
+            node = node._parent
+
+    def _attach(self, key: 'GraphQLKey'):
+        if key._parent is not None or key.frozen:
+            key = key.copy()
+        key._parent = self
+        self._children[key.name] = key
+        return key
+
+    def _detach(self, name: str):
+        key = self._children.pop(name)
+        key._parent = None
 
     def __eq__(self, other):
         if isinstance(other, GraphQLKey):
-            print(f"{self} {'==' if str(self)==str(other) else '!='} {other}")
-            return str(self) == str(other)
+            if self is other:
+                return True
+            return all((self.name == other.name,
+                        self.signature == other.signature,
+                        hash(self) == hash(other),
+                        self._children == other._children))
         if isinstance(other, str):
             return self.name == other
         return NotImplemented
 
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash((self.name, self.signature, frozenset(self._children.values())))
+        return self._hash
+
+    def __contains__(self, item):
+        if isinstance(item, GraphQLKey):
+            item = item.name
+        return item in self._children
+
     def __getitem__(self, item) -> 'GraphQLKey':
         if isinstance(item, str):
-            for key in self.keys:
-                if key.name == item:
-                    return key
-            new_key = GraphQLKey(name=item)
-            self.keys += (new_key,)
-            return new_key
+            try:
+                return self._children[item]
+            except KeyError:
+                self._check_frozen()
+                key = self._attach(GraphQLKey(name=item))
+                self._invalidate()
+                return key
         elif isinstance(item, GraphQLKey):
-            for key in self.keys:
-                if key.name == item.name:
-                    return key
-            self.keys += (item,)
-            return item
+            try:
+                return self._children[item.name]
+            except KeyError:
+                self._check_frozen()
+                key = self._attach(item)
+                self._invalidate()
+                return key
         raise TypeError
 
     def __str__(self):
-        after = ""
-        if self.signature:
-            after += f"({self.signature})"
-        if self.keys:
-            after += "{" + " ".join(map(str, self.keys)) + "}"
-        return f"{self.name}{after}"
+        if self._render is None:
+            after = ""
+            if self.signature:
+                after += f"({self.signature})"
+            if self._children:
+                after += "{" + " ".join(map(str, self._children.values())) + "}"
+            self._render = f"{self.name}{after}"
+        return self._render
 
-    def __add__(self, other):
-        if isinstance(other, dict):
-            other = GraphQLKey.from_dict(other, name=self.name)
-        if not isinstance(other, GraphQLKey):
-            raise TypeError(f"unsupported operand type(s) for +: 'GraphQLKey' and '{type(other)}'")
-        if not self.name == other.name:
-            raise ValueError('names must equal')
-        return GraphQLKey.from_dict(merge(self.to_dict(), other.to_dict()))
+    def __repr__(self):
+        return f"<GraphQLKey {self}>"
 
-    def __sub__(self, other):
+    def _other_key(self, other, operator: str):
         if isinstance(other, dict):
             other = GraphQLKey.from_dict(other, name=self.name)
         if not isinstance(other, GraphQLKey):
-            raise TypeError(f"unsupported operand type(s) for -: 'GraphQLKey' and '{type(other)}'")
+            raise TypeError(f"unsupported operand type(s) for {operator}: 'GraphQLKey' and '{type(other)}'")
         if not self.name == other.name:
             raise ValueError('names must equal')
+        return other
+
+    def merge(self, other: 'GraphQLKey'):
+        """Adds everything selected in other, in place"""
+        self._check_frozen()
+        for theirs in other._children.values():
+            mine = self._children.get(theirs.name)
+            if mine is None:
+                self._attach(theirs)
+            elif mine.signature != theirs.signature:
+                raise ValueError(f"Conflict at {self.name}.{theirs.name}")
+            else:
+                mine.merge(theirs)
+        self._invalidate()
+        return self
+
+    def subtract(self, other: 'GraphQLKey'):
+        """Removes everything selected in other, in place. Keys left without children are removed too"""
+        self._check_frozen()
+        for theirs in other._children.values():
+            mine = self._children.get(theirs.name)
+            if mine is None:
+                continue
+            if mine == theirs:
+                self._detach(mine.name)
+            elif theirs._children:
+                mine.subtract(theirs)
+                if not mine._children:
+                    self._detach(mine.name)
+        self._invalidate()
+        return self
+
+    def discard_present(self, data: dict):
+        """
+        Removes everything data already has a value for, in place
 
-        for key in other.keys:
-            my_keys = tuple()
-            for i in self.keys:
-                # don't add it back when it's the same thing
-                if i == key:
-                    continue
-                # check if it has children and we could subtract those
-                if i.name == key.name and len(key.keys) > 0:
-                    result = i - key
-                    if len(result.keys) == 0:
-                        continue
-                    my_keys += (result,)
-                else:
-                    my_keys += (i,)
-
-            self.keys = my_keys
+        Lists are all or nothing, they're only removed when every item has everything.
+        Values fetched with other arguments than the key has don't count
+        """
+        self._check_frozen()
+        fetched_with = data.get(FETCHED_WITH, dict())
+        for mine in list(self._children.values()):
+            if mine.name not in data or fetched_with.get(mine.name, "") != mine.signature:
+                continue
+            value = data[mine.name]
+            if not mine._children or value is None:
+                self._detach(mine.name)
+            elif isinstance(value, dict):
+                mine.discard_present(value)
+                if not mine._children:
+                    self._detach(mine.name)
+            elif isinstance(value, list):
+                if all(isinstance(i, dict) and not mine.copy().discard_present(i)._children for i in value):
+                    self._detach(mine.name)
+        self._invalidate()
         return self
 
+    def record_signatures(self, data: dict):
+        """Notes in data which of its fields were fetched with arguments, so discard_present can tell"""
+        for mine in self._children.values():
+            value = data.get(mine.name)
+            if value is None:
+                continue
+            if mine.signature:
+                data.setdefault(FETCHED_WITH, dict())[mine.name] = mine.signature
+            for item in value if isinstance(value, list) else [value]:
+                if isinstance(item, dict) and mine._children:
+                    mine.record_signatures(item)
+        return data
+
+    def __add__(self, other):
+        return self.copy().merge(self._other_key(other, '+'))
+
+    def __iadd__(self, other):
+        return self.merge(self._other_key(other, '+='))
+
+    def __sub__(self, other):
+        return self.copy().subtract(self._other_key(other, '-'))
+
+    def __isub__(self, other):
+        return self.subtract(self._other_key(other, '-='))
+
     @staticmethod
     def from_dict(dictionary: dict, *, name=None, signature=None):
         if name is None:
@@ -106,33 +229,31 @@ class GraphQLKey:
             else:
                 rv = GraphQLKey(name=name)
                 dictionary = dictionary[name]
+            if not isinstance(dictionary, dict):
+                return rv
         else:
             rv = GraphQLKey(name=name, signature=signature)
-        for key in dictionary:
+        for key, value in dictionary.items():
             assert isinstance(key, str)
-            if isinstance(dictionary[key], list):
-                dictionary[key] = dictionary[key][0]
-            if isinstance(dictionary[key], dict):
-                _ = rv[GraphQLKey.from_dict(dictionary[key], name=key)]
-            elif isinstance(dictionary[key], tuple):
-                _ = rv[GraphQLKey.from_dict(dictionary[key][1], name=key, signature=dictionary[key][0])]
+            if isinstance(value, list):
+                # Lists come from results, their first item stands for the rest
+                value = value[0] if value else None
+            if isinstance(value, dict):
+                rv._attach(GraphQLKey.from_dict(value, name=key))
+            elif isinstance(value, tuple):
+                children = value[1] if isinstance(value[1], dict) else dict()
+                rv._attach(GraphQLKey.from_dict(children, name=key, signature=value[0]))
             else:
-                _ = rv[key]
+                rv._attach(GraphQLKey(name=key))
         return rv
 
     def to_dict(self):
-        rv = dict()
+        dd = dict()
+        for key in self._children.values():
+            dd.update(key.to_dict())
         if self.signature:
-            dd = dict()
-            for key_dict in [key.to_dict() for key in self.keys]:
-                dd = {**dd, **key_dict}
-            rv[self.name] = (self.signature, dd if dd else '_')
-        else:
-            dd = dict()
-            for key_dict in [key.to_dict() for key in self.keys]:
-                dd = {**dd, **key_dict}
-            rv[self.name] = dd if dd else '_'
-        return rv
+            return {self.name: (self.signature, dd if dd else '_')}
+        return {self.name: dd if dd else '_'}
 
 
 false = False
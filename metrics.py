@@ -0,0 +1,171 @@
+"""
+Counters, gauges and histograms kept in memory and rendered in the Prometheus text format
+
+Everything here is plain dict and list work, so updating and rendering are cheap enough to do on the loop
+"""
+import bisect
+import collections
+import math
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = ""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and math.isnan(value):
+        return "NaN"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = tuple()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+
+    def _key(self, labels: dict):
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} takes labels {', '.join(self.label_names) or 'nothing'}")
+        return tuple(str(labels[i]) for i in self.label_names)
+
+    def samples(self):
+        """Yields (name suffix, label values, extra label, value)"""
+        return iter(())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.label_names, values, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = tuple()):
+        super().__init__(name, documentation, label_names)
+        self.values = collections.defaultdict(float)
+
+    def inc(self, amount=1, **labels):
+        self.values[self._key(labels)] += amount
+
+    def get(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self):
+        for values, value in list(self.values.items()):
+            yield "", values, "", value
+
+
+class Gauge(Metric):
+    """Either set directly or read from a function when rendered"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = tuple(), function=None):
+        super().__init__(name, documentation, label_names)
+        self.values = dict()
+        self.function = function
+
+    def set(self, value, **labels):
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        """function() returns the value, or a dict of label values tuple -> value for labelled gauges"""
+        self.function = function
+
+    def samples(self):
+        values = self.values
+        if self.function is not None:
+            try:
+                values = self.function()
+            except Exception:
+                return
+            if not isinstance(values, dict):
+                values = {tuple(): values}
+        for values, value in list(values.items()):
+            if value is None:
+                continue
+            yield "", values, "", value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+    default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = tuple(), buckets: tuple = None):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets or self.default_buckets)) + (math.inf,)
+        self.counts = dict()  # label values -> [count per bucket, not cumulative]
+        self.sums = collections.defaultdict(float)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts = self.counts.get(key)
+        if counts is None:
+            counts = self.counts[key] = [0] * len(self.buckets)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[key] += value
+
+    def samples(self):
+        for values, counts in list(self.counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield "_bucket", values, f'le="{_format_value(float(bound))}"', cumulative
+            yield "_sum", values, "", self.sums[values]
+            yield "_count", values, "", cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = collections.OrderedDict()
+
+    def _get_or_add(self, cls, name: str, *args, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"{name} is already a {metric.kind}")
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: tuple = tuple()) -> Counter:
+        return self._get_or_add(Counter, name, documentation, label_names)
+
+    def gauge(self, name: str, documentation: str, label_names: tuple = tuple(), function=None) -> Gauge:
+        gauge = self._get_or_add(Gauge, name, documentation, label_names)
+        if function is not None:
+            gauge.set_function(function)
+        return gauge
+
+    def stats(self, name: str, documentation: str, function) -> Gauge:
+        """Gauge labelled by stat, function returns a dict like the stats() methods around the bot do"""
+        return self.gauge(name, documentation, ('stat',),
+                          function=lambda: {(key,): float(value) for key, value in function().items()})
+
+    def histogram(self, name: str, documentation: str, label_names: tuple = tuple(),
+                  buckets: tuple = None) -> Histogram:
+        return self._get_or_add(Histogram, name, documentation, label_names, buckets)
+
+    def render(self):
+        return "\n".join(metric.render() for metric in list(self.metrics.values())) + "\n"
@@ -0,0 +1,205 @@
+"""
+Timing of the phases a command invocation goes through
+
+The invocation being worked on is kept in a context variable, so anything awaited by the command or started from it
+can add a span to it without being handed the context. Sampled invocations are written as Chrome trace-event JSON,
+which chrome://tracing and Perfetto open directly
+
+Context variables are why Alice needs Python 3.7
+"""
+import asyncio
+import collections
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+current = contextvars.ContextVar('alice_invocation', default=None)
+logger = logging.getLogger('alice.tracing')
+
+
+def _task_id():
+    """Id of the running task, or of the thread when there is no task"""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return id(task) if task is not None else threading.get_ident()
+
+
+class Invocation:
+    """One command invocation, phase times are summed so concurrent spans of the same phase add up"""
+
+    def __init__(self, command: str, key=None, started_at: float = None):
+        self.command = command
+        self.key = key
+        self.started_at = started_at or time.perf_counter()
+        self.finished_at = None
+        self.task = _task_id()
+        self.phases = collections.defaultdict(float)
+        self.spans = []  # (phase, started_at, finished_at, task id)
+
+    def add(self, phase: str, started_at: float, finished_at: float, task=None):
+        self.phases[phase] += finished_at - started_at
+        self.spans.append((phase, started_at, finished_at, task or self.task))
+
+    @property
+    def duration(self):
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+
+class Span:
+    """Times a phase of the current invocation, works with both with and async with"""
+    __slots__ = ('phase', 'invocation', 'started_at')
+
+    def __init__(self, phase: str):
+        self.phase = phase
+        self.invocation = current.get()
+        self.started_at = None
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.invocation is not None:
+            self.invocation.add(self.phase, self.started_at, time.perf_counter(), _task_id())
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.__exit__(exc_type, exc_val, exc_tb)
+
+
+def timed(phase: str):
+    """Decorator that puts the whole coroutine function in a span"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with Span(phase):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class RollingPercentiles:
+    """Keeps the last size samples, percentiles are worked out when asked for"""
+
+    def __init__(self, size=1000):
+        self.samples = collections.deque(maxlen=size)
+        self.count = 0
+
+    def add(self, value: float):
+        self.samples.append(value)
+        self.count += 1
+
+    def percentiles(self, *percents):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return [None for _ in percents]
+        return [ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] for p in percents]
+
+
+class TraceExporter:
+    """Writes sampled invocations, and every one slower than slow_ms, as Chrome trace-event JSON files"""
+
+    def __init__(self, directory='logs/traces', sample_rate=0.0, slow_ms=None, loop=None, executor=None):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.loop = loop
+        self.executor = executor
+        self.written = 0
+
+    def wanted(self, invocation: Invocation):
+        if self.slow_ms is not None and invocation.duration * 1000 >= self.slow_ms:
+            return True
+        return random.random() < self.sample_rate
+
+    def offer(self, invocation: Invocation):
+        """Writes the invocation in the executor if it is sampled, returns whether it was"""
+        if not self.wanted(invocation):
+            return False
+        if self.loop is None:
+            self.write(invocation)
+        else:
+            self.loop.run_in_executor(self.executor, self.write, invocation).add_done_callback(self._written)
+        return True
+
+    @staticmethod
+    def _written(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Writing a trace failed: {future.exception()!r}")
+
+    @staticmethod
+    def events(invocation: Invocation, pid: int = None):
+        """Trace events of the invocation, times are in microseconds from the start of the invocation"""
+        pid = pid or os.getpid()
+        spans = list(invocation.spans)  # Tasks the command started may still be adding to it
+        threads = {invocation.task: 1}
+        for _, _, _, task in spans:
+            threads.setdefault(task, len(threads) + 1)
+
+        def micros(moment):
+            return round((moment - invocation.started_at) * 1_000_000, 1)
+
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                   'args': {'name': invocation.command if tid == 1 else f"task {tid}"}}
+                  for tid in threads.values()]
+        events.append({'name': invocation.command, 'cat': 'command', 'ph': 'X', 'pid': pid, 'tid': 1, 'ts': 0,
+                       'dur': micros(invocation.finished_at or time.perf_counter()),
+                       'args': {'key': str(invocation.key)}})
+        for phase, started_at, finished_at, task in sorted(spans, key=lambda i: i[1]):
+            events.append({'name': phase, 'cat': 'phase', 'ph': 'X', 'pid': pid, 'tid': threads[task],
+                           'ts': micros(started_at), 'dur': round((finished_at - started_at) * 1_000_000, 1)})
+        return events
+
+    def write(self, invocation: Invocation):
+        os.makedirs(self.directory, exist_ok=True)
+        name = re.sub(r'[^\w-]+', '_', f"{invocation.key or int(invocation.started_at * 1000)}-{invocation.command}")
+        path = os.path.join(self.directory, f"{name}.json")
+        with open(path, 'w') as out_file:
+            json.dump({'traceEvents': self.events(invocation), 'displayTimeUnit': 'ms'}, out_file)
+        self.written += 1
+        return path
+
+
+class Tracker:
+    """Rolling percentiles of how long commands and their phases took"""
+
+    def __init__(self, size=1000, exporter: TraceExporter = None):
+        self.size = size
+        self.exporter = exporter
+        self.commands = dict()  # command -> RollingPercentiles
+        self.phases = dict()  # command -> phase -> RollingPercentiles
+
+    def start(self, command: str, key=None, started_at: float = None):
+        invocation = Invocation(command, key, started_at)
+        current.set(invocation)
+        return invocation
+
+    def finish(self, invocation: Invocation):
+        invocation.finished_at = time.perf_counter()
+        if current.get() is invocation:
+            current.set(None)
+        self._rolling(self.commands, invocation.command).add(invocation.duration)
+        phases = self.phases.setdefault(invocation.command, dict())
+        for phase, seconds in invocation.phases.items():
+            self._rolling(phases, phase).add(seconds)
+        if self.exporter is not None:
+            self.exporter.offer(invocation)
+
+    def _rolling(self, where: dict, name: str):
+        rolling = where.get(name)
+        if rolling is None:
+            rolling = where[name] = RollingPercentiles(self.size)
+        return rolling